@@ -1737,6 +1737,47 @@ def cert_info(cert, digest="sha256"):
     return ret
 
 
+def cert_validity(cert):
+    """
+    .. versionadded:: 3008.0
+
+    Return the validity period of a particular certificate as a
+    ``(not_before, not_after)`` tuple of Unix timestamps. This is a cheaper
+    alternative to :py:func:`tls.cert_info <salt.modules.tls.cert_info>` when
+    only the validity period is needed, since the subject, issuer, extensions
+    and fingerprint are not decoded.
+
+    cert
+        path to the certifiate PEM file or string
+
+    CLI Example:
+
+    .. code-block:: bash
+
+        salt '*' tls.cert_validity /dir/for/certs/cert.pem
+
+    """
+    # format that OpenSSL returns dates in
+    date_fmt = "%Y%m%d%H%M%SZ"
+    if "-----BEGIN" not in cert:
+        with salt.utils.files.fopen(cert) as cert_file:
+            cert = cert_file.read()
+    cert = OpenSSL.crypto.load_certificate(OpenSSL.crypto.FILETYPE_PEM, cert)
+
+    return (
+        calendar.timegm(
+            time.strptime(
+                cert.get_notBefore().decode(__salt_system_encoding__), date_fmt
+            )
+        ),
+        calendar.timegm(
+            time.strptime(
+                cert.get_notAfter().decode(__salt_system_encoding__), date_fmt
+            )
+        ),
+    )
+
+
 def create_empty_crl(
     ca_name, cacert_path=None, ca_filename=None, crl_file=None, digest="sha256"
 ):
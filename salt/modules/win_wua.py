@@ -264,7 +264,7 @@ def available(
     """
 
     # Create a Windows Update Agent instance
-    wua = salt.utils.win_update.WindowsUpdateAgent(online=online)
+    wua = salt.utils.win_update.WindowsUpdateAgent(online=online, context=__context__)
 
     # Look for available
     updates = wua.available(
@@ -365,7 +365,7 @@ def get(name, download=False, install=False, online=True):
         salt '*' win_wua.get 'Microsoft Camera Codec Pack'
     """
     # Create a Windows Update Agent instance
-    wua = salt.utils.win_update.WindowsUpdateAgent(online=online)
+    wua = salt.utils.win_update.WindowsUpdateAgent(online=online, context=__context__)
 
     # Search for Update
     updates = wua.search(name)
@@ -524,7 +524,7 @@ def list(
         salt '*' win_wua.list categories=['Feature Packs','Windows 8.1'] summary=True
     """
     # Create a Windows Update Agent instance
-    wua = salt.utils.win_update.WindowsUpdateAgent(online=online)
+    wua = salt.utils.win_update.WindowsUpdateAgent(online=online, context=__context__)
 
     # Search for Update
     updates = wua.available(
@@ -603,7 +603,7 @@ def installed(summary=False, kbs_only=False):
     """
     # Create a Windows Update Agent instance. Since we're only listing installed
     # updates, there's no need to go online to update the Windows Update db
-    wua = salt.utils.win_update.WindowsUpdateAgent(online=False)
+    wua = salt.utils.win_update.WindowsUpdateAgent(online=False, context=__context__)
     updates = wua.installed()  # Get installed Updates objects
     results = updates.list()  # Convert to list
 
@@ -647,7 +647,7 @@ def download(names):
         salt '*' win_wua.download names=['12345678-abcd-1234-abcd-1234567890ab', 'KB2131233']
     """
     # Create a Windows Update Agent instance
-    wua = salt.utils.win_update.WindowsUpdateAgent()
+    wua = salt.utils.win_update.WindowsUpdateAgent(context=__context__)
 
     # Search for Update
     updates = wua.search(names)
@@ -701,7 +701,7 @@ def install(names):
         salt '*' win_wua.install KB12323211
     """
     # Create a Windows Update Agent instance
-    wua = salt.utils.win_update.WindowsUpdateAgent()
+    wua = salt.utils.win_update.WindowsUpdateAgent(context=__context__)
 
     # Search for Updates
     updates = wua.search(names)
@@ -752,7 +752,7 @@ def uninstall(names):
         salt '*' win_wua.uninstall guid=['12345678-abcd-1234-abcd-1234567890ab', 'KB1231231']
     """
     # Create a Windows Update Agent instance
-    wua = salt.utils.win_update.WindowsUpdateAgent()
+    wua = salt.utils.win_update.WindowsUpdateAgent(context=__context__)
 
     # Search for Updates
     updates = wua.search(names)
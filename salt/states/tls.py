@@ -2,10 +2,24 @@
 Enforce state for SSL/TLS
 =========================
 
+The validity period of checked certificates is kept in ``__context__`` for
+the duration of a state run, so a certificate that is checked by several
+states is only read and parsed once. Within a run, a cached entry is reused
+until the certificate file changes, and the file itself is only looked at
+again once the entry is older than ``tls_state_cache_ttl`` seconds
+(default: 60). The cache can be disabled altogether with
+``tls_state_cache_enabled``, in which case every check reads the certificate
+again. Both can be set in the minion configuration:
+
+.. code-block:: yaml
+
+    tls_state_cache_enabled: True
+    tls_state_cache_ttl: 60
 """
 
 import datetime
 import logging
+import os
 import time
 
 __virtualname__ = "tls"
@@ -19,48 +33,162 @@ def __virtual__():
     return __virtualname__
 
 
-def valid_certificate(name, weeks=0, days=0, hours=0, minutes=0, seconds=0):
+def _read_validity(name):
     """
-    Verify that a TLS certificate is valid now and (optionally) will be valid
-    for the time specified through weeks, days, hours, minutes, and seconds.
+    Return the ``(not_before, not_after)`` timestamps of the certificate.
+    Falls back to ``tls.cert_info`` on minions whose tls module does not
+    provide ``tls.cert_validity`` yet.
     """
-    ret = {"name": name, "changes": {}, "result": False, "comment": ""}
+    if "tls.cert_validity" in __salt__:
+        return tuple(__salt__["tls.cert_validity"](name))
+    cert_info = __salt__["tls.cert_info"](name)
+    return cert_info["not_before"], cert_info["not_after"]
+
+
+def _cert_validity(name, now):
+    """
+    Return the validity period of ``name`` as a cache entry, reusing the
+    previous entry as long as the certificate file has not been modified since.
+    Entries that have been compared against the file within the last
+    ``tls_state_cache_ttl`` seconds are reused without looking at the file.
+    Nothing is cached if ``tls_state_cache_enabled`` is ``False``.
+    """
+    if not __opts__.get("tls_state_cache_enabled", True):
+        not_before, not_after = _read_validity(name)
+        return {"not_before": not_before, "not_after": not_after, "nbf_verified": False}
+
+    # Validity period per certificate path, along with the (mtime, size) of
+    # the certificate file it was read from and when that was last compared
+    # against the file (``checked``). ``nbf_verified`` is set once the
+    # certificate has been seen past its ``not_before`` date, since that cannot
+    # become false again for the same file.
+    cache = __context__.setdefault("tls.cert_validity", {})
+    entry = cache.get(name)
+    if entry is not None and now - entry["checked"] < __opts__.get(
+        "tls_state_cache_ttl", 60
+    ):
+        return entry
 
-    now = time.time()
     try:
-        cert_info = __salt__["tls.cert_info"](name)
+        stat = os.stat(name)
+    except (OSError, ValueError):
+        # Not a file we can stat (e.g. a PEM string), don't cache
+        stat = None
+        cache.pop(name, None)
+    else:
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if entry is not None and entry["signature"] == signature:
+            entry["checked"] = now
+            return entry
+
+    not_before, not_after = _read_validity(name)
+    entry = {"not_before": not_before, "not_after": not_after, "nbf_verified": False}
+    if stat is not None:
+        entry["signature"] = signature
+        entry["checked"] = now
+        cache[name] = entry
+    return entry
+
+
+def _min_seconds(weeks, days, hours, minutes, seconds):
+    return weeks * 604800 + days * 86400 + hours * 3600 + minutes * 60 + seconds
+
+
+def _check_certificate(name, now, min_seconds):
+    """
+    Check the certificate ``name`` against the point in time ``now`` and the
+    required remaining validity ``min_seconds``.
+
+    Returns a ``(result, comment)`` tuple.
+    """
+    try:
+        validity = _cert_validity(name, now)
     except OSError as exc:
-        ret["comment"] = f"{exc}"
-        ret["result"] = False
-        log.error(ret["comment"])
-        return ret
+        log.error("%s", exc)
+        return False, f"{exc}"
 
     # verify that the cert is valid *now*
-    if now < cert_info["not_before"]:
-        ret["comment"] = "Certificate is not yet valid"
-        return ret
-    if now > cert_info["not_after"]:
-        ret["comment"] = "Certificate is expired"
-        return ret
+    not_after = validity["not_after"]
+    if now > not_after:
+        return False, "Certificate is expired"
+    if not validity["nbf_verified"]:
+        if now < validity["not_before"]:
+            return False, "Certificate is not yet valid"
+        validity["nbf_verified"] = True
+
+    # no minimum remaining validity requested, nothing left to compare
+    if not min_seconds:
+        return True, "Certificate is valid"
 
     # verify the cert will be valid for defined time
-    delta_remaining = datetime.timedelta(seconds=cert_info["not_after"] - now)
-    delta_kind_map = {
-        "weeks": weeks,
-        "days": days,
-        "hours": hours,
-        "minutes": minutes,
-        "seconds": seconds,
-    }
-
-    delta_min = datetime.timedelta(**delta_kind_map)
-    # if ther eisn't enough time remaining, we consider it a failure
-    if delta_remaining < delta_min:
-        ret["comment"] = "Certificate will expire in {}, which is less than {}".format(
-            delta_remaining, delta_min
+    remaining = not_after - now
+
+    delta_remaining = datetime.timedelta(seconds=remaining)
+    # if there isn't enough time remaining, we consider it a failure
+    if remaining < min_seconds:
+        delta_min = datetime.timedelta(seconds=min_seconds)
+        return (
+            False,
+            f"Certificate will expire in {delta_remaining}, "
+            f"which is less than {delta_min}",
         )
-        return ret
 
-    ret["result"] = True
-    ret["comment"] = f"Certificate is valid for {delta_remaining}"
+    return True, f"Certificate is valid for {delta_remaining}"
+
+
+def valid_certificate(name, weeks=0, days=0, hours=0, minutes=0, seconds=0):
+    """
+    Verify that a TLS certificate is valid now and (optionally) will be valid
+    for the time specified through weeks, days, hours, minutes, and seconds.
+    """
+    ret = {"name": name, "changes": {}, "result": False, "comment": ""}
+
+    ret["result"], ret["comment"] = _check_certificate(
+        name, time.time(), _min_seconds(weeks, days, hours, minutes, seconds)
+    )
+    return ret
+
+
+def valid_certificates(
+    name, certificates, weeks=0, days=0, hours=0, minutes=0, seconds=0
+):
+    """
+    .. versionadded:: 3008.0
+
+    Verify that several TLS certificates are valid now and (optionally) will
+    be valid for the time specified through weeks, days, hours, minutes, and
+    seconds. This is equivalent to calling ``tls.valid_certificate`` for each
+    of them, but reports the outcome as a single state.
+
+    name
+        An arbitrary name for this state
+
+    certificates
+        A list of paths to the certificates to verify. A single path can be
+        passed as a string
+
+    .. code-block:: yaml
+
+        web-certs:
+          tls.valid_certificates:
+            - certificates:
+              - /etc/pki/tls/certs/www.example.com.crt
+              - /etc/pki/tls/certs/api.example.com.crt
+            - days: 14
+    """
+    if isinstance(certificates, str):
+        certificates = [certificates]
+
+    ret = {"name": name, "changes": {}, "result": True, "comment": ""}
+
+    now = time.time()
+    min_seconds = _min_seconds(weeks, days, hours, minutes, seconds)
+    comments = []
+    for cert in certificates:
+        result, comment = _check_certificate(cert, now, min_seconds)
+        if not result:
+            ret["result"] = False
+        comments.append(f"{cert}: {comment}")
+
+    ret["comment"] = "\n".join(comments)
     return ret
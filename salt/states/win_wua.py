@@ -135,7 +135,7 @@ def installed(name, updates=None):
 
     ret = {"name": name, "changes": {}, "result": True, "comment": ""}
 
-    wua = salt.utils.win_update.WindowsUpdateAgent()
+    wua = salt.utils.win_update.WindowsUpdateAgent(context=__context__)
 
     # Search for updates
     install_list = wua.search(updates)
@@ -293,7 +293,7 @@ def removed(name, updates=None):
 
     ret = {"name": name, "changes": {}, "result": True, "comment": ""}
 
-    wua = salt.utils.win_update.WindowsUpdateAgent()
+    wua = salt.utils.win_update.WindowsUpdateAgent(context=__context__)
 
     # Search for updates
     updates = wua.search(updates)
@@ -460,7 +460,7 @@ def uptodate(
     """
     ret = {"name": name, "changes": {}, "result": True, "comment": ""}
 
-    wua = salt.utils.win_update.WindowsUpdateAgent()
+    wua = salt.utils.win_update.WindowsUpdateAgent(context=__context__)
 
     available_updates = wua.available(
         skip_hidden=skip_hidden,
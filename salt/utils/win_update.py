@@ -2,15 +2,21 @@
 Classes for working with Windows Update Agent
 """
 
+import collections
+import functools
 import logging
+import re
 import subprocess
+import threading
+import time
+import weakref
 
 import salt.utils.args
-import salt.utils.data
 import salt.utils.winapi
 from salt.exceptions import CommandExecutionError
 
 try:
+    import pythoncom
     import pywintypes
     import win32com.client
 
@@ -20,14 +26,41 @@ except ImportError:
 
 log = logging.getLogger(__name__)
 
-REBOOT_BEHAVIOR = {
-    0: "Never Requires Reboot",
-    1: "Always Requires Reboot",
-    2: "Can Require Reboot",
-}
+# Indexed by the InstallationBehavior.RebootBehavior of an update
+REBOOT_BEHAVIOR = (
+    "Never Requires Reboot",
+    "Always Requires Reboot",
+    "Can Require Reboot",
+)
+
+# Packages removed by a single dism command in the DISM uninstall fallback.
+# Keeps the command line well below its length limit.
+DISM_BATCH_SIZE = 50
+
+# Matches the name of a package in the output of dism /Get-Packages
+_DISM_PACKAGE_RE = re.compile(r"package identity\s*:\s*(\S+)", re.IGNORECASE)
+
+# Matches the KB numbers in the name of a package
+_KB_RE = re.compile(r"kb(\d+)", re.IGNORECASE)
+
+# Seconds the result of needs_reboot is reused
+NEEDS_REBOOT_TTL = 5
+
+# Returned by CoInitializeEx if the thread already joined another apartment
+RPC_E_CHANGED_MODE = -2147417850
+
+# Seconds the results of a search cached in ``__context__`` are reused by the
+# next WindowsUpdateAgent
+CONTEXT_TTL = 300
 
 __virtualname__ = "win_update"
 
+# Threads in which COM has been initialized by _init_com
+_COM_THREAD = threading.local()
+
+# The last result of needs_reboot
+_NEEDS_REBOOT = {"stamp": 0.0, "value": None}
+
 
 def __virtual__():
     if not salt.utils.platform.is_windows():
@@ -37,6 +70,162 @@ def __virtual__():
     return __virtualname__
 
 
+def _init_com():
+    """
+    Initialize COM in the calling thread, once per thread. Unlike
+    ``salt.utils.winapi.Com``, COM is not uninitialized again, since the
+    objects created are used long after the call that created them returns.
+    Threads that already joined the multithreaded apartment, like the workers
+    of ``Updates.list``, keep using it.
+    """
+    if getattr(_COM_THREAD, "initialized", False):
+        return
+    try:
+        pythoncom.CoInitializeEx(pythoncom.COINIT_APARTMENTTHREADED)
+    except pywintypes.com_error as exc:
+        if _com_error_code(exc) != RPC_E_CHANGED_MODE:
+            raise
+    _COM_THREAD.initialized = True
+
+
+def _dispatch(prog_id):
+    """
+    Create the COM object for ``prog_id``. The early-bound wrapper generated
+    from the type library is preferred, since it resolves the IDs of
+    properties and methods once instead of on every access. Falls back to a
+    late-bound object if the wrapper can't be generated.
+
+    Args:
+
+        prog_id (str):
+            The ProgID of the object, e.g. ``Microsoft.Update.Session``
+
+    Returns:
+        The COM object
+    """
+    try:
+        return win32com.client.gencache.EnsureDispatch(prog_id)
+    except Exception as exc:  # pylint: disable=broad-except
+        log.debug("Failed to create early-bound %s object: %s", prog_id, exc)
+        return win32com.client.Dispatch(prog_id)
+
+
+def _com_error_code(error):
+    """
+    Get the error code reported by the Windows Update Agent from a COM error.
+    The code is reported in the exception info of ``IDispatch::Invoke``, the
+    ``HRESULT`` of the call is used if there is none.
+
+    Args:
+
+        error (pywintypes.com_error):
+            The COM error
+
+    Returns:
+        int: The error code
+    """
+    hr, _, exc, _ = error.args
+    return exc[5] if exc else hr
+
+
+def _translate_com_error(error, table):
+    """
+    Look up the message for the error code of a COM error.
+
+    Args:
+
+        error (Exception):
+            The COM error
+
+        table (dict):
+            Messages keyed by error code, e.g.
+            ``WindowsUpdateAgent.fail_codes``
+
+    Returns:
+        str: The message, or a generic one for unknown error codes
+    """
+    return table.get(_com_error_code(error), f"Unknown Failure: {error}")
+
+
+def _reboot_behavior(value):
+    """
+    Look up the description of the reboot behavior of an update. Values
+    outside of the known range are clamped to the nearest known behavior.
+
+    Args:
+
+        value (int):
+            The ``RebootBehavior`` of the ``InstallationBehavior`` of an update
+
+    Returns:
+        str: The description of the reboot behavior
+    """
+    return REBOOT_BEHAVIOR[min(max(value, 0), len(REBOOT_BEHAVIOR) - 1)]
+
+
+def _requires_reboot(update):
+    """
+    Check whether installing an update can require a reboot.
+
+    Args:
+
+        update:
+            The ``IUpdate`` COM object
+
+    Returns:
+        bool: ``True`` if the update can require a reboot
+    """
+    # Windows 10 build 2004 introduced some problems with the
+    # InstallationBehavior COM Object. See
+    # https://github.com/saltstack/salt/issues/57762 for more details.
+    # The update is assumed to require a reboot if it can't be read
+    try:
+        return bool(update.InstallationBehavior.RebootBehavior)
+    except AttributeError:
+        log.debug("Windows Update: Error reading InstallationBehavior COM Object")
+        return True
+
+
+def _uninstall_reboot_behavior(update):
+    """
+    Read the reboot behavior of uninstalling an update.
+
+    Args:
+
+        update:
+            The ``IUpdate`` COM object
+
+    Returns:
+        int: The ``RebootBehavior`` of the ``UninstallationBehavior`` of the
+        update, ``2`` if it can't be read
+    """
+    # The behavior COM objects can't always be read. See
+    # https://github.com/saltstack/salt/issues/57762 for more details.
+    try:
+        return update.UninstallationBehavior.RebootBehavior
+    except AttributeError:
+        log.debug("Windows Update: Error reading UninstallationBehavior COM Object")
+        return 2
+
+
+def _iter_coll(coll):
+    """
+    Iterate over a COM collection by index. This avoids the enumerator
+    wrapper pywin32 uses for ``for`` loops over COM objects, which fetches and
+    converts the items one at a time.
+
+    Args:
+
+        coll:
+            The COM collection, e.g. a ``Microsoft.Update.UpdateColl``
+
+    Returns:
+        generator: The items of the collection
+    """
+    count = coll.Count
+    return (coll.Item(index) for index in range(count))
+
+
 class Updates:
     """
     Wrapper around the 'Microsoft.Update.UpdateColl' instance
@@ -75,8 +264,37 @@ class Updates:
         Initialize the updates collection. Can be accessed via
         ``Updates.updates``
         """
-        with salt.utils.winapi.Com():
-            self.updates = win32com.client.Dispatch("Microsoft.Update.UpdateColl")
+        _init_com()
+        self.updates = _dispatch("Microsoft.Update.UpdateColl")
+
+    @classmethod
+    def from_existing(cls, collection):
+        """
+        Wrap an existing collection instead of creating a new one and adding
+        each update to it. The collection is shared, not copied.
+
+        .. versionadded:: 3008.0
+
+        Args:
+
+            collection:
+                The ``Microsoft.Update.UpdateColl`` to wrap
+
+        Returns:
+            Updates: An instance of Updates for the collection
+
+        Code Example:
+
+        .. code-block:: python
+
+            import salt.utils.win_update
+            wua = salt.utils.win_update.WindowsUpdateAgent()
+            updates = salt.utils.win_update.Updates.from_existing(wua._updates)
+            updates.list()
+        """
+        updates = cls.__new__(cls)
+        updates.updates = collection
+        return updates
 
     def count(self):
         """
@@ -139,50 +357,75 @@ class Updates:
         log.debug("Building a detailed report of the results.")
 
         # Build a dictionary containing details for each update
-        results = {}
-        for update in self.updates:
+        return {
+            uid: dict(details, Severity=str(details["Severity"]))
+            for uid, details in self._snapshot.items()
+        }
 
-            # Windows 10 build 2004 introduced some problems with the
-            # InstallationBehavior COM Object. See
-            # https://github.com/saltstack/salt/issues/57762 for more details.
-            # The following 2 try/except blocks will output sane defaults
-            try:
-                user_input = bool(update.InstallationBehavior.CanRequestUserInput)
-            except AttributeError:
-                log.debug(
-                    "Windows Update: Error reading InstallationBehavior COM Object"
-                )
-                user_input = False
+    @functools.cached_property
+    def _snapshot(self):
+        """
+        The details of the updates in the collection, read from the COM
+        objects once and shared by ``list`` and ``summary``. Built on first
+        use, so all updates must be added to the collection before either of
+        them is called.
 
-            try:
-                requires_reboot = update.InstallationBehavior.RebootBehavior
-            except AttributeError:
-                log.debug(
-                    "Windows Update: Error reading InstallationBehavior COM Object"
-                )
-                requires_reboot = 2
-
-            # IUpdate Properties
-            # https://docs.microsoft.com/en-us/windows/win32/wua_sdk/iupdate-properties
-            results[update.Identity.UpdateID] = {
-                "guid": update.Identity.UpdateID,
-                "Title": str(update.Title),
-                "Type": self.update_types[update.Type],
-                "Description": update.Description,
-                "Downloaded": bool(update.IsDownloaded),
-                "Installed": bool(update.IsInstalled),
-                "Mandatory": bool(update.IsMandatory),
-                "EULAAccepted": bool(update.EulaAccepted),
-                "NeedsReboot": bool(update.RebootRequired),
-                "Severity": str(update.MsrcSeverity),
-                "UserInput": user_input,
-                "RebootBehavior": REBOOT_BEHAVIOR[requires_reboot],
-                "KBs": ["KB" + item for item in update.KBArticleIDs],
-                "Categories": [item.Name for item in update.Categories],
-                "SupportUrl": update.SupportUrl,
-            }
+        Returns:
+            dict: The details of each update, keyed by its ID. The severity is
+            kept as returned by the Windows Update Agent
+        """
+        return dict(self._details(update) for update in _iter_coll(self.updates))
 
-        return results
+    def _details(self, update):
+        """
+        Read the details of a single update.
+
+        Args:
+
+            update:
+                The ``IUpdate`` COM object
+
+        Returns:
+            tuple: The ID of the update and a dictionary with its details as
+            returned by ``list``, except for the severity, which isn't
+            converted to a string
+        """
+        # Every property read is a call into the COM object, so read each
+        # of them only once
+        uid = update.Identity.UpdateID
+
+        # Windows 10 build 2004 introduced some problems with the
+        # InstallationBehavior COM Object. See
+        # https://github.com/saltstack/salt/issues/57762 for more details.
+        # Sane defaults are used if it can't be read
+        try:
+            behavior = update.InstallationBehavior
+            user_input = bool(behavior.CanRequestUserInput)
+            requires_reboot = behavior.RebootBehavior
+        except AttributeError:
+            log.debug("Windows Update: Error reading InstallationBehavior COM Object")
+            user_input = False
+            requires_reboot = 2
+
+        # IUpdate Properties
+        # https://docs.microsoft.com/en-us/windows/win32/wua_sdk/iupdate-properties
+        return uid, {
+            "guid": uid,
+            "Title": str(update.Title),
+            "Type": self.update_types[update.Type],
+            "Description": update.Description,
+            "Downloaded": bool(update.IsDownloaded),
+            "Installed": bool(update.IsInstalled),
+            "Mandatory": bool(update.IsMandatory),
+            "EULAAccepted": bool(update.EulaAccepted),
+            "NeedsReboot": bool(update.RebootRequired),
+            "Severity": update.MsrcSeverity,
+            "UserInput": user_input,
+            "RebootBehavior": _reboot_behavior(requires_reboot),
+            "KBs": ["KB" + item for item in update.KBArticleIDs],
+            "Categories": [item.Name for item in update.Categories],
+            "SupportUrl": update.SupportUrl,
+        }
 
     def summary(self):
         """
@@ -225,43 +468,41 @@ class Updates:
             "Categories": {},
             "Severity": {},
         }
+        categories = collections.Counter()
+        severities = collections.Counter()
 
-        for update in self.updates:
+        for details in self._snapshot.values():
+
+            downloaded = details["Downloaded"]
+            installed = details["Installed"]
+            severity = details["Severity"]
 
             # Count the total number of updates available
             results["Total"] += 1
 
             # Updates available for download
-            if not salt.utils.data.is_true(
-                update.IsDownloaded
-            ) and not salt.utils.data.is_true(update.IsInstalled):
+            if not downloaded and not installed:
                 results["Available"] += 1
 
             # Updates downloaded awaiting install
-            if salt.utils.data.is_true(
-                update.IsDownloaded
-            ) and not salt.utils.data.is_true(update.IsInstalled):
+            if downloaded and not installed:
                 results["Downloaded"] += 1
 
             # Updates installed
-            if salt.utils.data.is_true(update.IsInstalled):
+            if installed:
                 results["Installed"] += 1
 
             # Add Categories and increment total for each one
             # The sum will be more than the total because each update can have
             # multiple categories
-            for category in update.Categories:
-                if category.Name in results["Categories"]:
-                    results["Categories"][category.Name] += 1
-                else:
-                    results["Categories"][category.Name] = 1
+            categories.update(details["Categories"])
 
             # Add Severity Summary
-            if update.MsrcSeverity:
-                if update.MsrcSeverity in results["Severity"]:
-                    results["Severity"][update.MsrcSeverity] += 1
-                else:
-                    results["Severity"][update.MsrcSeverity] = 1
+            if severity:
+                severities[severity] += 1
+
+        results["Categories"] = dict(categories)
+        results["Severity"] = dict(severities)
 
         return results
 
@@ -302,7 +543,7 @@ class WindowsUpdateAgent:
         -4292607995: "Reboot required: 0x00240005",
     }
 
-    def __init__(self, online=True):
+    def __init__(self, online=True, context=None):
         """
         Initialize the session and load all updates into the ``_updates``
         collection. This collection is used by the other class functions instead
@@ -317,23 +558,87 @@ class WindowsUpdateAgent:
 
                 .. versionadded:: 3001
 
-        Need to look at the possibility of loading this into ``__context__``
+            context (dict):
+                The ``__context__`` of the calling module. The session and the
+                updates found are cached in it, and reused by agents created
+                with the same ``online`` setting in the same thread within
+                ``CONTEXT_TTL`` seconds. The cache is cleared after updates
+                are downloaded, installed or uninstalled. Default is ``None``,
+                which doesn't cache anything
+
+                .. versionadded:: 3008.0
         """
+        self._context = context
+
+        cached = self._get_context(online)
+        if cached is not None:
+            log.debug("Using the Windows Update Agent session cached in __context__")
+            self._session = cached["session"]
+            self._updates = cached["updates"]
+            self._online = online
+            self._search_cache = cached["search_cache"]
+            return
+
         # Initialize the PyCom system
-        with salt.utils.winapi.Com():
+        _init_com()
+
+        # Create a session with the Windows Update Agent
+        self._session = _dispatch("Microsoft.Update.Session")
 
-            # Create a session with the Windows Update Agent
-            self._session = win32com.client.Dispatch("Microsoft.Update.Session")
+        # Create Collection for Updates
+        self._updates = _dispatch("Microsoft.Update.UpdateColl")
 
-            # Create Collection for Updates
-            self._updates = win32com.client.Dispatch("Microsoft.Update.UpdateColl")
+        # Results of searches by search criteria, keyed by (online, criteria)
+        self._online = online
+        self._search_cache = {}
 
         self.refresh(online=online)
 
+    def _get_context(self, online):
+        """
+        Get the session and the updates cached in ``__context__``, if they are
+        still fresh. COM objects can only be used in the thread that created
+        them, so entries cached by another thread are ignored. The owning
+        thread is tracked by a weak reference, thread idents are reused once
+        a thread exits.
+
+        Args:
+
+            online (bool):
+                Whether the cached search must have gone online
+
+        Returns:
+            dict: The cached entry, or ``None`` if there is none to reuse
+        """
+        if self._context is None:
+            return None
+        cached = self._context.get("win_update.agent")
+        if cached is None:
+            return None
+        owner = cached["thread"]()
+        if (
+            cached["online"] != online
+            or owner is not threading.current_thread()
+            or not owner.is_alive()
+            or time.monotonic() - cached["stamp"] >= CONTEXT_TTL
+        ):
+            return None
+        return cached
+
+    def _invalidate_context(self):
+        """
+        Forget the searches cached by this agent and in ``__context__``. Used
+        after changing which updates are downloaded or installed.
+        """
+        self._search_cache = {}
+        if self._context is not None:
+            self._context.pop("win_update.agent", None)
+
     def updates(self):
         """
         Get the contents of ``_updates`` (all updates) and puts them in an
-        Updates class to expose the list and summary functions.
+        Updates class to expose the list and summary functions. The collection
+        is shared with the agent, not copied.
 
         Returns:
 
@@ -355,13 +660,7 @@ class WindowsUpdateAgent:
             # To get a summary
             updates.summary()
         """
-        updates = Updates()
-        found = updates.updates
-
-        for update in self._updates:
-            found.Add(update)
-
-        return updates
+        return Updates.from_existing(self._updates)
 
     def refresh(self, online=True):
         """
@@ -386,32 +685,65 @@ class WindowsUpdateAgent:
             wua = salt.utils.win_update.WindowsUpdateAgent()
             wua.refresh()
         """
-        # https://msdn.microsoft.com/en-us/library/windows/desktop/aa386526(v=vs.85).aspx
+        # Start over with a fresh view of the update database
+        self._online = online
+        self._search_cache = {}
+
         search_string = "Type='Software' or Type='Driver'"
+        updates = self._search(search_string)
+        if updates.Count == 0:
+            log.debug("No Updates found for:\n\t\t%s", search_string)
+            return f"No Updates found: {search_string}"
+
+        self._updates = updates
+
+        if self._context is not None:
+            self._context["win_update.agent"] = {
+                "session": self._session,
+                "updates": self._updates,
+                "search_cache": self._search_cache,
+                "online": online,
+                "thread": weakref.ref(threading.current_thread()),
+                "stamp": time.monotonic(),
+            }
+
+    def _search(self, criteria):
+        """
+        Search the Windows Update database using the WUA search criteria
+        syntax, so the filtering is done by the Windows Update Agent instead of
+        iterating over all updates here. Results are cached per criteria until
+        the next ``refresh``.
+
+        Args:
+
+            criteria (str):
+                The search criteria, e.g. ``IsInstalled=1``. See
+                https://learn.microsoft.com/en-us/windows/win32/api/wuapi/nf-wuapi-iupdatesearcher-search
+
+        Returns:
+            The ``Microsoft.Update.UpdateColl`` with the updates found
+        """
+        key = (self._online, criteria)
+        if key in self._search_cache:
+            return self._search_cache[key]
 
         # Create searcher object
         searcher = self._session.CreateUpdateSearcher()
-        searcher.Online = online
+        searcher.Online = self._online
         self._session.ClientApplicationID = "Salt: Load Updates"
 
-        # Load all updates into the updates collection
+        # https://msdn.microsoft.com/en-us/library/windows/desktop/aa386526(v=vs.85).aspx
         try:
-            results = searcher.Search(search_string)
-            if results.Updates.Count == 0:
-                log.debug("No Updates found for:\n\t\t%s", search_string)
-                return f"No Updates found: {search_string}"
+            results = searcher.Search(criteria)
         except pywintypes.com_error as error:
             # Something happened, raise an error
-            hr, msg, exc, arg = error.args  # pylint: disable=W0633
-            try:
-                failure_code = self.fail_codes[exc[5]]
-            except KeyError:
-                failure_code = f"Unknown Failure: {error}"
+            failure_code = _translate_com_error(error, self.fail_codes)
 
-            log.error("Search Failed: %s\n\t\t%s", failure_code, search_string)
+            log.error("Search Failed: %s\n\t\t%s", failure_code, criteria)
             raise CommandExecutionError(failure_code)
 
-        self._updates = results.Updates
+        self._search_cache[key] = results.Updates
+        return results.Updates
 
     def installed(self):
         """
@@ -432,10 +764,11 @@ class WindowsUpdateAgent:
         """
         # https://msdn.microsoft.com/en-us/library/windows/desktop/aa386099(v=vs.85).aspx
         updates = Updates()
+        found_add = updates.updates.Add
 
-        for update in self._updates:
-            if salt.utils.data.is_true(update.IsInstalled):
-                updates.updates.Add(update)
+        for update in _iter_coll(self._updates):
+            if update.IsInstalled:
+                found_add(update)
 
         return updates
 
@@ -525,55 +858,44 @@ class WindowsUpdateAgent:
         """
         # https://msdn.microsoft.com/en-us/library/windows/desktop/aa386099(v=vs.85).aspx
         updates = Updates()
-        found = updates.updates
-
-        for update in self._updates:
-
-            if salt.utils.data.is_true(update.IsHidden) and skip_hidden:
-                continue
-
-            if salt.utils.data.is_true(update.IsInstalled) and skip_installed:
-                continue
-
-            if salt.utils.data.is_true(update.IsMandatory) and skip_mandatory:
-                continue
-
-            # Windows 10 build 2004 introduced some problems with the
-            # InstallationBehavior COM Object. See
-            # https://github.com/saltstack/salt/issues/57762 for more details.
-            # The following try/except block will default to True
-            try:
-                requires_reboot = salt.utils.data.is_true(
-                    update.InstallationBehavior.RebootBehavior
+        found_add = updates.updates.Add
+
+        # All updates are either software or driver updates
+        if not software and not drivers:
+            return updates
+
+        # The updates were all found by the search in refresh, so filter them
+        # here instead of searching again. Only check the filters that were
+        # asked for
+        skip = []
+        if skip_hidden:
+            skip.append(lambda update: update.IsHidden)
+        if skip_installed:
+            skip.append(lambda update: update.IsInstalled)
+        if not software:
+            skip.append(lambda update: update.Type == 1)
+        if not drivers:
+            skip.append(lambda update: update.Type == 2)
+        if skip_mandatory:
+            skip.append(lambda update: update.IsMandatory)
+        if skip_reboot:
+            skip.append(_requires_reboot)
+        if categories is not None:
+            categories = set(categories)
+            skip.append(
+                lambda update: categories.isdisjoint(
+                    category.Name for category in update.Categories
                 )
-            except AttributeError:
-                log.debug(
-                    "Windows Update: Error reading InstallationBehavior COM Object"
-                )
-                requires_reboot = True
-
-            if requires_reboot and skip_reboot:
-                continue
+            )
+        if severities is not None:
+            skip.append(lambda update: update.MsrcSeverity not in severities)
 
-            if not software and update.Type == 1:
-                continue
+        for update in _iter_coll(self._updates):
 
-            if not drivers and update.Type == 2:
+            if skip and any(check(update) for check in skip):
                 continue
 
-            if categories is not None:
-                match = False
-                for category in update.Categories:
-                    if category.Name in categories:
-                        match = True
-                if not match:
-                    continue
-
-            if severities is not None:
-                if update.MsrcSeverity not in severities:
-                    continue
-
-            found.Add(update)
+            found_add(update)
 
         return updates
 
@@ -609,37 +931,33 @@ class WindowsUpdateAgent:
             updates.list()
         """
         updates = Updates()
-        found = updates.updates
+        found_add = updates.updates.Add
 
-        if isinstance(search_string, str):
+        if isinstance(search_string, (str, int)):
             search_string = [search_string]
 
-        if isinstance(search_string, int):
-            search_string = [str(search_string)]
-
-        for update in self._updates:
+        terms = {str(find) for find in search_string}
 
-            for find in search_string:
+        for update in _iter_coll(self._updates):
 
-                # Search by GUID
-                if find == update.Identity.UpdateID:
-                    found.Add(update)
-                    continue
-
-                # Search by KB
-                if find in ["KB" + item for item in update.KBArticleIDs]:
-                    found.Add(update)
-                    continue
+            # Search by GUID
+            if update.Identity.UpdateID in terms:
+                found_add(update)
+                continue
 
-                # Search by KB without the KB in front
-                if find in [item for item in update.KBArticleIDs]:
-                    found.Add(update)
-                    continue
+            # Search by KB, with or without the KB in front
+            kb_variants = set()
+            for item in update.KBArticleIDs:
+                kb_variants.add(item)
+                kb_variants.add("KB" + item)
+            if not terms.isdisjoint(kb_variants):
+                found_add(update)
+                continue
 
-                # Search by Title
-                if find in update.Title:
-                    found.Add(update)
-                    continue
+            # Search by Title
+            title = str(update.Title)
+            if any(find in title for find in terms):
+                found_add(update)
 
         return updates
 
@@ -678,12 +996,13 @@ class WindowsUpdateAgent:
         downloader = self._session.CreateUpdateDownloader()
         self._session.ClientApplicationID = "Salt: Download Update"
         with salt.utils.winapi.Com():
-            download_list = win32com.client.Dispatch("Microsoft.Update.UpdateColl")
+            download_list = _dispatch("Microsoft.Update.UpdateColl")
 
             ret = {"Updates": {}}
+            added_uids = []
 
             # Check for updates that aren't already downloaded
-            for update in updates.updates:
+            for update in _iter_coll(updates.updates):
 
                 # Define uid to keep the lines shorter
                 uid = update.Identity.UpdateID
@@ -692,15 +1011,16 @@ class WindowsUpdateAgent:
                 ret["Updates"][uid]["AlreadyDownloaded"] = bool(update.IsDownloaded)
 
                 # Accept EULA
-                if not salt.utils.data.is_true(update.EulaAccepted):
+                if not update.EulaAccepted:
                     log.debug("Accepting EULA: %s", update.Title)
                     update.AcceptEula()  # pylint: disable=W0104
 
                 # Update already downloaded
-                if not salt.utils.data.is_true(update.IsDownloaded):
+                if not update.IsDownloaded:
                     log.debug("To Be Downloaded: %s", uid)
                     log.debug("\tTitle: %s", update.Title)
                     download_list.Add(update)
+                    added_uids.append(uid)
 
             # Check the download list
             if download_list.Count == 0:
@@ -716,11 +1036,7 @@ class WindowsUpdateAgent:
                 result = downloader.Download()
             except pywintypes.com_error as error:
                 # Something happened, raise an error
-                hr, msg, exc, arg = error.args  # pylint: disable=W0633
-                try:
-                    failure_code = self.fail_codes[exc[5]]
-                except KeyError:
-                    failure_code = f"Unknown Failure: {error}"
+                failure_code = _translate_com_error(error, self.fail_codes)
 
                 log.error("Download Failed: %s", failure_code)
                 raise CommandExecutionError(failure_code)
@@ -736,6 +1052,7 @@ class WindowsUpdateAgent:
             }
 
             log.debug("Download Complete")
+            self._invalidate_context()
             log.debug(result_code[result.ResultCode])
             ret["Message"] = result_code[result.ResultCode]
 
@@ -748,8 +1065,7 @@ class WindowsUpdateAgent:
                 ret["Success"] = False
 
             # Report results for each update
-            for i in range(download_list.Count):
-                uid = download_list.Item(i).Identity.UpdateID
+            for i, uid in enumerate(added_uids):
                 ret["Updates"][uid]["Result"] = result_code[
                     result.GetUpdateResult(i).ResultCode
                 ]
@@ -791,12 +1107,13 @@ class WindowsUpdateAgent:
         installer = self._session.CreateUpdateInstaller()
         self._session.ClientApplicationID = "Salt: Install Update"
         with salt.utils.winapi.Com():
-            install_list = win32com.client.Dispatch("Microsoft.Update.UpdateColl")
+            install_list = _dispatch("Microsoft.Update.UpdateColl")
 
             ret = {"Updates": {}}
+            added = []
 
             # Check for updates that aren't already installed
-            for update in updates.updates:
+            for update in _iter_coll(updates.updates):
 
                 # Define uid to keep the lines shorter
                 uid = update.Identity.UpdateID
@@ -805,10 +1122,11 @@ class WindowsUpdateAgent:
                 ret["Updates"][uid]["AlreadyInstalled"] = bool(update.IsInstalled)
 
                 # Make sure the update has actually been installed
-                if not salt.utils.data.is_true(update.IsInstalled):
+                if not update.IsInstalled:
                     log.debug("To Be Installed: %s", uid)
                     log.debug("\tTitle: %s", update.Title)
                     install_list.Add(update)
+                    added.append((uid, update))
 
             # Check the install list
             if install_list.Count == 0:
@@ -825,11 +1143,7 @@ class WindowsUpdateAgent:
 
             except pywintypes.com_error as error:
                 # Something happened, raise an error
-                hr, msg, exc, arg = error.args  # pylint: disable=W0633
-                try:
-                    failure_code = self.fail_codes[exc[5]]
-                except KeyError:
-                    failure_code = f"Unknown Failure: {error}"
+                failure_code = _translate_com_error(error, self.fail_codes)
 
                 log.error("Install Failed: %s", failure_code)
                 raise CommandExecutionError(failure_code)
@@ -845,6 +1159,8 @@ class WindowsUpdateAgent:
             }
 
             log.debug("Install Complete")
+            self._invalidate_context()
+            needs_reboot.invalidate()
             log.debug(result_code[result.ResultCode])
             ret["Message"] = result_code[result.ResultCode]
 
@@ -856,25 +1172,24 @@ class WindowsUpdateAgent:
                 log.debug("Install Failed")
                 ret["Success"] = False
 
-            for i in range(install_list.Count):
-                uid = install_list.Item(i).Identity.UpdateID
+            for i, (uid, update) in enumerate(added):
                 ret["Updates"][uid]["Result"] = result_code[
                     result.GetUpdateResult(i).ResultCode
                 ]
                 # Windows 10 build 2004 introduced some problems with the
                 # InstallationBehavior COM Object. See
                 # https://github.com/saltstack/salt/issues/57762 for more details.
-                # The following try/except block will default to 2
+                # Default to 2 if it can't be read
                 try:
-                    reboot_behavior = install_list.Item(
-                        i
-                    ).InstallationBehavior.RebootBehavior
+                    reboot_behavior = update.InstallationBehavior.RebootBehavior
                 except AttributeError:
                     log.debug(
                         "Windows Update: Error reading InstallationBehavior COM Object"
                     )
                     reboot_behavior = 2
-                ret["Updates"][uid]["RebootBehavior"] = REBOOT_BEHAVIOR[reboot_behavior]
+                ret["Updates"][uid]["RebootBehavior"] = _reboot_behavior(
+                    reboot_behavior
+                )
 
         return ret
 
@@ -925,24 +1240,37 @@ class WindowsUpdateAgent:
         installer = self._session.CreateUpdateInstaller()
         self._session.ClientApplicationID = "Salt: Uninstall Update"
         with salt.utils.winapi.Com():
-            uninstall_list = win32com.client.Dispatch("Microsoft.Update.UpdateColl")
+            uninstall_list = _dispatch("Microsoft.Update.UpdateColl")
 
             ret = {"Updates": {}}
+            added = []
+            # The reboot behavior of each update is read once, the reports
+            # below look it up by uid
+            reboot_cache = {}
 
             # Check for updates that aren't already installed
-            for update in updates.updates:
+            for update in _iter_coll(updates.updates):
+
+                # Check whether the update is installed first, nothing but the
+                # ID and title is read from updates that are already
+                # uninstalled
+                installed = bool(update.IsInstalled)
 
                 # Define uid to keep the lines shorter
                 uid = update.Identity.UpdateID
-                ret["Updates"][uid] = {}
-                ret["Updates"][uid]["Title"] = update.Title
-                ret["Updates"][uid]["AlreadyUninstalled"] = not bool(update.IsInstalled)
+                title = update.Title
+                ret["Updates"][uid] = {
+                    "Title": title,
+                    "AlreadyUninstalled": not installed,
+                }
+                if not installed:
+                    continue
 
-                # Make sure the update has actually been Uninstalled
-                if salt.utils.data.is_true(update.IsInstalled):
-                    log.debug("To Be Uninstalled: %s", uid)
-                    log.debug("\tTitle: %s", update.Title)
-                    uninstall_list.Add(update)
+                log.debug("To Be Uninstalled: %s", uid)
+                log.debug("\tTitle: %s", title)
+                uninstall_list.Add(update)
+                added.append(uid)
+                reboot_cache[uid] = _uninstall_reboot_behavior(update)
 
             # Check the install list
             if uninstall_list.Count == 0:
@@ -959,46 +1287,52 @@ class WindowsUpdateAgent:
 
             except pywintypes.com_error as error:
                 # Something happened, return error or try using DISM
-                hr, msg, exc, arg = error.args  # pylint: disable=W0633
-                try:
-                    failure_code = self.fail_codes[exc[5]]
-                except KeyError:
-                    failure_code = f"Unknown Failure: {error}"
+                failure_code = _translate_com_error(error, self.fail_codes)
 
                 # If "Uninstall Not Allowed" error, try using DISM
-                if exc[5] == -2145124312:
+                if _com_error_code(error) == -2145124312:
                     log.debug("Uninstall Failed with WUA, attempting with DISM")
                     try:
 
-                        # Go through each update...
-                        for item in uninstall_list:
-
-                            # Look for the KB numbers
+                        # Collect the KB numbers of all updates once, the KB
+                        # prefix is optional
+                        wanted_kbs = {}
+                        for item in _iter_coll(uninstall_list):
                             for kb in item.KBArticleIDs:
-
-                                # Get the list of packages
-                                cmd = ["dism", "/Online", "/Get-Packages"]
-                                pkg_list = self._run(cmd)[0].splitlines()
-
-                                # Find the KB in the pkg_list
-                                for item in pkg_list:
-
-                                    # Uninstall if found
-                                    if "kb" + kb in item.lower():
-                                        pkg = item.split(" : ")[1]
-
-                                        ret["DismPackage"] = pkg
-
-                                        cmd = [
-                                            "dism",
-                                            "/Online",
-                                            "/Remove-Package",
-                                            f"/PackageName:{pkg}",
-                                            "/Quiet",
-                                            "/NoRestart",
-                                        ]
-
-                                        self._run(cmd)
+                                wanted_kbs[kb.upper().lstrip("KB")] = None
+
+                        # Get the list of packages once and map the wanted KB
+                        # numbers in their names to them
+                        cmd = ["dism", "/Online", "/Get-Packages"]
+                        kb_to_pkg = {}
+                        for line in self._run_lines(cmd):
+                            match = _DISM_PACKAGE_RE.search(line)
+                            if not match:
+                                continue
+                            pkg = match.group(1)
+                            for kb in _KB_RE.findall(pkg):
+                                if kb in wanted_kbs:
+                                    kb_to_pkg.setdefault(kb, []).append(pkg)
+
+                        # Collect the packages found for the KB numbers
+                        pkgs_to_remove = {}
+                        for kb in wanted_kbs:
+                            for pkg in kb_to_pkg.get(kb, []):
+                                ret["DismPackage"] = pkg
+                                pkgs_to_remove[pkg] = None
+
+                        # Uninstall the packages in as few dism runs as
+                        # possible
+                        pkgs_to_remove = list(pkgs_to_remove)
+                        for start in range(0, len(pkgs_to_remove), DISM_BATCH_SIZE):
+                            batch = pkgs_to_remove[start : start + DISM_BATCH_SIZE]
+                            cmd = ["dism", "/Online", "/Remove-Package"]
+                            cmd.extend(f"/PackageName:{pkg}" for pkg in batch)
+                            cmd.extend(["/Quiet", "/NoRestart"])
+                            # Servicing can take a long time, killing dism
+                            # in the middle of it would leave the packages
+                            # in an inconsistent state
+                            self._run(cmd, capture=False, timeout=None)
 
                     except CommandExecutionError as exc:
                         log.debug("Uninstall using DISM failed")
@@ -1014,42 +1348,28 @@ class WindowsUpdateAgent:
                     # Populate the return dictionary
                     ret["Success"] = True
                     ret["Message"] = "Uninstalled using DISM"
+                    needs_reboot.invalidate()
                     ret["NeedsReboot"] = needs_reboot()
                     log.debug("NeedsReboot: %s", ret["NeedsReboot"])
 
                     # Refresh the Updates Table
                     self.refresh(online=False)
 
-                    # Check the status of each update
-                    for update in self._updates:
+                    # Check the status of each update. The uninstalled updates
+                    # are known already, so the refreshed list is only walked
+                    # once
+                    for update in _iter_coll(self._updates):
                         uid = update.Identity.UpdateID
-                        for item in uninstall_list:
-                            if item.Identity.UpdateID == uid:
-                                if not update.IsInstalled:
-                                    ret["Updates"][uid][
-                                        "Result"
-                                    ] = "Uninstallation Succeeded"
-                                else:
-                                    ret["Updates"][uid][
-                                        "Result"
-                                    ] = "Uninstallation Failed"
-                                # Windows 10 build 2004 introduced some problems with the
-                                # InstallationBehavior COM Object. See
-                                # https://github.com/saltstack/salt/issues/57762 for more details.
-                                # The following try/except block will default to 2
-                                try:
-                                    requires_reboot = (
-                                        update.InstallationBehavior.RebootBehavior
-                                    )
-                                except AttributeError:
-                                    log.debug(
-                                        "Windows Update: Error reading"
-                                        " InstallationBehavior COM Object"
-                                    )
-                                    requires_reboot = 2
-                                ret["Updates"][uid]["RebootBehavior"] = REBOOT_BEHAVIOR[
-                                    requires_reboot
-                                ]
+                        if uid not in reboot_cache:
+                            continue
+                        if update.IsInstalled:
+                            result = "Uninstallation Failed"
+                        else:
+                            result = "Uninstallation Succeeded"
+                        ret["Updates"][uid]["Result"] = result
+                        ret["Updates"][uid]["RebootBehavior"] = _reboot_behavior(
+                            reboot_cache[uid]
+                        )
 
                     return ret
 
@@ -1068,6 +1388,8 @@ class WindowsUpdateAgent:
             }
 
             log.debug("Uninstall Complete")
+            self._invalidate_context()
+            needs_reboot.invalidate()
             log.debug(result_code[result.ResultCode])
             ret["Message"] = result_code[result.ResultCode]
 
@@ -1079,29 +1401,17 @@ class WindowsUpdateAgent:
                 log.debug("Uninstall Failed")
                 ret["Success"] = False
 
-            for i in range(uninstall_list.Count):
-                uid = uninstall_list.Item(i).Identity.UpdateID
+            for i, uid in enumerate(added):
                 ret["Updates"][uid]["Result"] = result_code[
                     result.GetUpdateResult(i).ResultCode
                 ]
-                # Windows 10 build 2004 introduced some problems with the
-                # InstallationBehavior COM Object. See
-                # https://github.com/saltstack/salt/issues/57762 for more details.
-                # The following try/except block will default to 2
-                try:
-                    reboot_behavior = uninstall_list.Item(
-                        i
-                    ).InstallationBehavior.RebootBehavior
-                except AttributeError:
-                    log.debug(
-                        "Windows Update: Error reading InstallationBehavior COM Object"
-                    )
-                    reboot_behavior = 2
-                ret["Updates"][uid]["RebootBehavior"] = REBOOT_BEHAVIOR[reboot_behavior]
+                ret["Updates"][uid]["RebootBehavior"] = _reboot_behavior(
+                    reboot_cache[uid]
+                )
 
         return ret
 
-    def _run(self, cmd):
+    def _run(self, cmd, capture=True, timeout=300):
         """
         Internal function for running commands. Used by the uninstall function.
 
@@ -1109,27 +1419,129 @@ class WindowsUpdateAgent:
             cmd (str, list):
                 The command to run
 
+            capture (bool):
+                Capture the output of the command. When ``False`` the output
+                is discarded. Default is ``True``
+
+                .. versionadded:: 3008.0
+
+            timeout (int):
+                The number of seconds to wait for the command to finish.
+                ``None`` waits until the command is done. Default is 300
+
+                .. versionadded:: 3008.0
+
         Returns:
-            str: The stdout of the command
+            tuple: The stdout and stderr of the command, ``None`` for both if
+            the output is not captured
         """
 
         if isinstance(cmd, str):
             cmd = salt.utils.args.shlex_split(cmd)
 
+        if capture:
+            kwargs = {"capture_output": True}
+        else:
+            kwargs = {"stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+
         try:
             log.debug(cmd)
-            p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            return p.communicate()
+            res = subprocess.run(cmd, check=False, timeout=timeout, **kwargs)
+            return res.stdout, res.stderr
+
+        except subprocess.TimeoutExpired:
+            log.debug("Command Timed Out: %s", " ".join(cmd))
+            raise CommandExecutionError(
+                f"Command timed out after {timeout} seconds: {' '.join(cmd)}"
+            )
 
         except OSError as exc:
             log.debug("Command Failed: %s", " ".join(cmd))
             log.debug("Error: %s", exc)
             raise CommandExecutionError(exc)
 
+    def _run_lines(self, cmd, timeout=300):
+        """
+        Internal function for running commands and reading their output line
+        by line, without holding all of it in memory. Used by the uninstall
+        function.
+
+        .. versionadded:: 3008.0
+
+        Args:
+            cmd (str, list):
+                The command to run
+
+            timeout (int):
+                The number of seconds to wait for the command to finish.
+                ``None`` waits until the command is done. Default is 300
+
+        Yields:
+            str: The lines of the stdout of the command
+
+        Raises:
+            CommandExecutionError: If the command can't be run, times out or
+            returns a non-zero exit code
+        """
+
+        if isinstance(cmd, str):
+            cmd = salt.utils.args.shlex_split(cmd)
+
+        try:
+            log.debug(cmd)
+            proc = subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                errors="replace",
+            )
+
+        except OSError as exc:
+            log.debug("Command Failed: %s", " ".join(cmd))
+            log.debug("Error: %s", exc)
+            raise CommandExecutionError(exc)
+
+        # Reading the output blocks, so the deadline can't be checked between
+        # lines. Kill the command from a timer instead, which ends the output
+        expired = threading.Event()
+
+        def _kill():
+            expired.set()
+            proc.kill()
+
+        timer = None
+        if timeout is not None:
+            timer = threading.Timer(timeout, _kill)
+            timer.daemon = True
+            timer.start()
+
+        try:
+            with proc:
+                yield from proc.stdout
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        if expired.is_set():
+            log.debug("Command Timed Out: %s", " ".join(cmd))
+            raise CommandExecutionError(
+                f"Command timed out after {timeout} seconds: {' '.join(cmd)}"
+            )
+
+        if proc.returncode:
+            log.debug("Command Failed: %s", " ".join(cmd))
+            log.debug("Exit Code: %s", proc.returncode)
+            raise CommandExecutionError(
+                f"Command failed with exit code {proc.returncode}: {' '.join(cmd)}"
+            )
+
 
 def needs_reboot():
     """
-    Determines if the system needs to be rebooted.
+    Determines if the system needs to be rebooted. The result is reused for
+    ``NEEDS_REBOOT_TTL`` seconds. Call ``needs_reboot.invalidate()`` to read
+    it again on the next call.
 
     Returns:
 
@@ -1144,6 +1556,12 @@ def needs_reboot():
         salt.utils.win_update.needs_reboot()
 
     """
+    if (
+        _NEEDS_REBOOT["value"] is not None
+        and time.monotonic() - _NEEDS_REBOOT["stamp"] < NEEDS_REBOOT_TTL
+    ):
+        return _NEEDS_REBOOT["value"]
+
     # Initialize the PyCom system
     with salt.utils.winapi.Com():
         # Create an AutoUpdate object
@@ -1153,4 +1571,16 @@ def needs_reboot():
             _, msg, _, _ = exc.args
             log.debug("Failed to create SystemInfo object: %s", msg)
             return False
-        return salt.utils.data.is_true(obj_sys.RebootRequired)
+        _NEEDS_REBOOT["value"] = bool(obj_sys.RebootRequired)
+        _NEEDS_REBOOT["stamp"] = time.monotonic()
+        return _NEEDS_REBOOT["value"]
+
+
+def _invalidate_needs_reboot():
+    """
+    Discard the cached result of ``needs_reboot``
+    """
+    _NEEDS_REBOOT["value"] = None
+
+
+needs_reboot.invalidate = _invalidate_needs_reboot
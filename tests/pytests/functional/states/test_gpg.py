@@ -1,4 +1,5 @@
 import contextlib
+import functools
 import shutil
 import subprocess
 from pathlib import Path
@@ -14,6 +15,52 @@ pytestmark = [
 ]
 
 
+@functools.lru_cache(maxsize=None)
+def _gpg_connect_agent():
+    """
+    Look up gpg-connect-agent once, it doesn't change during the test run
+    """
+    return shutil.which("gpg-connect-agent")
+
+
+def _kill_gpg_agent(root):
+    """
+    Make sure we don't leave any gpg-agents running behind
+    """
+    killed_ok = False
+    gpg_connect_agent = _gpg_connect_agent()
+    if gpg_connect_agent:
+        gnupghome = root / ".gnupg"
+        if not gnupghome.is_dir():
+            gnupghome = root
+        try:
+            subprocess.run(
+                [gpg_connect_agent, "killagent", "/bye"],
+                env={"GNUPGHOME": str(gnupghome)},
+                shell=False,
+                check=True,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
+            killed_ok = True
+        except subprocess.CalledProcessError:
+            # This is likely CentOS 7 or Amazon Linux 2
+            pass
+
+    # If the above errored, as a last resort, let's check the running
+    # processes.
+    if not killed_ok:
+        for proc in psutil.process_iter(attrs=["name", "cmdline"]):
+            try:
+                if "gpg-agent" not in proc.info["name"]:
+                    continue
+                for arg in proc.info["cmdline"] or ():
+                    if str(root) in arg:
+                        proc.terminate()
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+
 @pytest.fixture
 def gpghome(tmp_path):
     root = tmp_path / "gpghome"
@@ -21,35 +68,42 @@ def gpghome(tmp_path):
     try:
         yield root
     finally:
-        # Make sure we don't leave any gpg-agents running behind
-        gpg_connect_agent = shutil.which("gpg-connect-agent")
-        if gpg_connect_agent:
-            gnupghome = root / ".gnupg"
-            if not gnupghome.is_dir():
-                gnupghome = root
-            try:
-                subprocess.run(
-                    [gpg_connect_agent, "killagent", "/bye"],
-                    env={"GNUPGHOME": str(gnupghome)},
-                    shell=False,
-                    check=True,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                )
-            except subprocess.CalledProcessError:
-                # This is likely CentOS 7 or Amazon Linux 2
-                pass
+        _kill_gpg_agent(root)
 
-        # If the above errored or was not enough, as a last resort, let's check
-        # the running processes.
-        for proc in psutil.process_iter():
-            try:
-                if "gpg-agent" in proc.name():
-                    for arg in proc.cmdline():
-                        if str(root) in arg:
-                            proc.terminate()
-            except Exception:  # pylint: disable=broad-except
-                pass
+
+@pytest.fixture(scope="session")
+def _gpg_templates(tmp_path_factory):
+    """
+    Build GnuPG homes and keyrings with some keys imported once per session.
+    Tests get copies of them, which is much cheaper than importing the keys
+    for every test.
+    """
+    templates = {}
+    homes = []
+
+    def _template(keys, pubkeys, fingerprints, keyring=False):
+        if (keys, keyring) not in templates:
+            root = tmp_path_factory.mktemp("gpghome")
+            root.chmod(0o0700)
+            homes.append(root)
+            if keyring:
+                target = root / "keys.gpg"
+                gnupg = gnupglib.GPG(gnupghome=str(root), keyring=str(target))
+            else:
+                target = root
+                gnupg = gnupglib.GPG(gnupghome=str(root))
+            gnupg.import_keys("\n".join(pubkeys))
+            present_keys = gnupg.list_keys()
+            for fp in fingerprints:
+                assert any(x["fingerprint"] == fp for x in present_keys)
+            templates[(keys, keyring)] = target
+        return templates[(keys, keyring)]
+
+    try:
+        yield _template
+    finally:
+        for root in homes:
+            _kill_gpg_agent(root)
 
 
 @pytest.fixture
@@ -183,27 +237,27 @@ def gnupg_keyring(gpghome, keyring):
 
 
 @pytest.fixture(params=["a"])
-def _pubkeys_present(gnupg, request):
+def _pubkeys_present(gpghome, _gpg_templates, request):
     pubkeys = [request.getfixturevalue(f"key_{x}_pub") for x in request.param]
     fingerprints = [request.getfixturevalue(f"key_{x}_fp") for x in request.param]
-    gnupg.import_keys("\n".join(pubkeys))
-    present_keys = gnupg.list_keys()
-    for fp in fingerprints:
-        assert any(x["fingerprint"] == fp for x in present_keys)
+    template = _gpg_templates(tuple(request.param), pubkeys, fingerprints)
+    shutil.copytree(
+        template,
+        gpghome,
+        dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns("S.*", "*.lock"),
+    )
     yield
     # cleanup is taken care of by gpghome and tmp_path
 
 
 @pytest.fixture(params=["a"])
-def keyring(gpghome, tmp_path, request):
+def keyring(gpghome, tmp_path, _gpg_templates, request):
     keyring = tmp_path / "keys.gpg"
-    _gnupg_keyring = gnupglib.GPG(gnupghome=str(gpghome), keyring=str(keyring))
     pubkeys = [request.getfixturevalue(f"key_{x}_pub") for x in request.param]
     fingerprints = [request.getfixturevalue(f"key_{x}_fp") for x in request.param]
-    _gnupg_keyring.import_keys("\n".join(pubkeys))
-    present_keys = _gnupg_keyring.list_keys()
-    for fp in fingerprints:
-        assert any(x["fingerprint"] == fp for x in present_keys)
+    template = _gpg_templates(tuple(request.param), pubkeys, fingerprints, keyring=True)
+    shutil.copy2(template, keyring)
     yield str(keyring)
     # cleanup is taken care of by gpghome and tmp_path
 
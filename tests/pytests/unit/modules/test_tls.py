@@ -415,6 +415,23 @@ def test_cert_info(tls_test_data):
         assert result == ret
 
 
+def test_cert_validity(tls_test_data):
+    """
+    Test cert validity
+    """
+    with patch("salt.utils.files.fopen", mock_open(read_data=tls_test_data["ca_cert"])):
+        result = tls.cert_validity("/tmp/test_tls/test_ca/test_ca_ca_cert.crt")
+    assert result == (1430843961, 1462379961)
+
+
+def test_cert_validity_pem_string(tls_test_data):
+    """
+    Test cert validity when passing the certificate contents
+    """
+    result = tls.cert_validity(tls_test_data["ca_cert"])
+    assert result == (1430843961, 1462379961)
+
+
 def test_create_ca(tmp_path, tls_test_data):
     """
     Test creating CA cert
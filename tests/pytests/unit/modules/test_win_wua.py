@@ -15,6 +15,11 @@ pytestmark = [
 ]
 
 
+@pytest.fixture
+def configure_loader_modules():
+    return {win_wua: {}}
+
+
 @pytest.fixture
 def updates_list():
     return {
@@ -37,6 +42,9 @@ def updates_summary():
 
 
 class Updates:
+    def __init__(self):
+        self.updates = MagicMock(Count=0)
+
     @staticmethod
     def list():
         return {
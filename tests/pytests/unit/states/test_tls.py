@@ -0,0 +1,198 @@
+"""
+Test cases for salt.states.tls
+"""
+
+import time
+
+import pytest
+
+import salt.states.tls as tls
+from tests.support.mock import MagicMock, patch
+
+
+@pytest.fixture
+def configure_loader_modules():
+    return {tls: {}}
+
+
+@pytest.fixture
+def cert_file(tmp_path):
+    cert = tmp_path / "cert.pem"
+    cert.write_text("not really a certificate")
+    return str(cert)
+
+
+def _cert_validity(not_before, not_after):
+    return MagicMock(return_value=(not_before, not_after))
+
+
+def test_valid_certificate(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 86400 * 30)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificate(cert_file, days=7)
+    assert ret["result"] is True
+    assert ret["comment"].startswith("Certificate is valid for")
+
+
+def test_valid_certificate_not_yet_valid(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now + 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificate(cert_file)
+    assert ret["result"] is False
+    assert ret["comment"] == "Certificate is not yet valid"
+
+
+def test_valid_certificate_expired(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 86400, now - 3600)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificate(cert_file)
+    assert ret["result"] is False
+    assert ret["comment"] == "Certificate is expired"
+
+
+def test_valid_certificate_expiring(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificate(cert_file, weeks=1)
+    assert ret["result"] is False
+    assert ret["comment"].startswith("Certificate will expire in")
+    assert ret["comment"].endswith("which is less than 7 days, 0:00:00")
+
+
+def test_valid_certificate_missing():
+    mock_validity = MagicMock(side_effect=OSError("No such file"))
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificate("/does/not/exist.pem")
+    assert ret["result"] is False
+    assert ret["comment"] == "No such file"
+
+
+def test_valid_certificate_cert_info_fallback(cert_file):
+    now = time.time()
+    mock_info = MagicMock(
+        return_value={
+            "not_before": now - 3600,
+            "not_after": now + 86400,
+            "subject": {"CN": "localhost"},
+        }
+    )
+    with patch.dict(tls.__salt__, {"tls.cert_info": mock_info}):
+        ret = tls.valid_certificate(cert_file)
+    assert ret["result"] is True
+    mock_info.assert_called_once_with(cert_file)
+
+
+def test_valid_certificate_cached(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        tls.valid_certificate(cert_file)
+        tls.valid_certificate(cert_file)
+    mock_validity.assert_called_once_with(cert_file)
+
+
+def test_valid_certificate_cache_invalidated_on_change(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}), patch.dict(
+        tls.__opts__, {"tls_state_cache_ttl": 0}
+    ):
+        tls.valid_certificate(cert_file)
+        with open(cert_file, "a") as fh:
+            fh.write("renewed")
+        tls.valid_certificate(cert_file)
+    assert mock_validity.call_count == 2
+
+
+def test_valid_certificate_not_before_verified_once(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now + 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificate(cert_file)
+        assert ret["comment"] == "Certificate is not yet valid"
+        assert tls.__context__["tls.cert_validity"][cert_file]["nbf_verified"] is False
+
+        with patch("time.time", MagicMock(return_value=now + 7200)):
+            ret = tls.valid_certificate(cert_file)
+        assert ret["result"] is True
+        assert tls.__context__["tls.cert_validity"][cert_file]["nbf_verified"] is True
+
+
+def test_valid_certificates(tmp_path):
+    now = time.time()
+    good = tmp_path / "good.pem"
+    good.write_text("good")
+    expiring = tmp_path / "expiring.pem"
+    expiring.write_text("expiring")
+    validity = {
+        str(good): (now - 3600, now + 86400 * 30),
+        str(expiring): (now - 3600, now + 86400),
+    }
+    mock_validity = MagicMock(side_effect=validity.get)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificates("certs", [str(good)], days=7)
+        assert ret["result"] is True
+        assert ret["comment"].startswith(f"{good}: Certificate is valid for")
+
+        ret = tls.valid_certificates("certs", [str(good), str(expiring)], days=7)
+        assert ret["result"] is False
+        assert ret["changes"] == {}
+        comments = ret["comment"].splitlines()
+        assert comments[0].startswith(f"{good}: Certificate is valid for")
+        assert comments[1].startswith(f"{expiring}: Certificate will expire in")
+    assert mock_validity.call_count == 2
+
+
+def test_valid_certificates_single_path(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificates("certs", cert_file)
+    assert ret["result"] is True
+    assert ret["comment"] == f"{cert_file}: Certificate is valid"
+    mock_validity.assert_called_once_with(cert_file)
+
+
+def test_valid_certificate_no_minimum(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 60)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}):
+        ret = tls.valid_certificate(cert_file)
+    assert ret["result"] is True
+    assert ret["comment"] == "Certificate is valid"
+
+
+def test_valid_certificate_cache_ttl(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}), patch.dict(
+        tls.__opts__, {"tls_state_cache_ttl": 60}
+    ):
+        tls.valid_certificate(cert_file)
+        with patch("os.stat", MagicMock(side_effect=OSError)) as mock_stat:
+            tls.valid_certificate(cert_file)
+        mock_stat.assert_not_called()
+        mock_validity.assert_called_once_with(cert_file)
+
+        # past the TTL, the file is looked at again
+        with patch("time.time", MagicMock(return_value=now + 120)):
+            with open(cert_file, "a") as fh:
+                fh.write("renewed")
+            tls.valid_certificate(cert_file)
+        assert mock_validity.call_count == 2
+
+
+def test_valid_certificate_cache_disabled(cert_file):
+    now = time.time()
+    mock_validity = _cert_validity(now - 3600, now + 86400)
+    with patch.dict(tls.__salt__, {"tls.cert_validity": mock_validity}), patch.dict(
+        tls.__opts__, {"tls_state_cache_enabled": False}
+    ):
+        tls.valid_certificate(cert_file)
+        tls.valid_certificate(cert_file)
+    assert mock_validity.call_count == 2
+    assert "tls.cert_validity" not in tls.__context__
@@ -8,7 +8,7 @@ import pytest
 
 import salt.states.win_wua as win_wua
 import salt.utils.platform
-import salt.utils.win_update as win_update
+import salt.utils.win_update
 from tests.support.mock import MagicMock, patch
 
 
@@ -83,7 +83,7 @@ def updates_summary():
 
 class Updates:
     def __init__(self):
-        self.updates = []
+        self.updates = MagicMock(Count=0)
 
 
 @pytest.fixture
@@ -150,18 +150,32 @@ def test_uptodate_test_mode():
         "result": None,
         "comment": "Updates will be installed:",
     }
+    update = MagicMock(
+        IsInstalled=False,
+        IsDownloaded=False,
+        KBArticleIDs=["4052623"],
+        Categories=[],
+        Title="Update",
+        Type=1,
+    )
+    update.Identity.UpdateID = "eac02b09-d745-4891-b80f-400e0e5e4b6d"
+    update.InstallationBehavior.RebootBehavior = 0
+    collection = MagicMock(Count=1)
+    collection.Item.return_value = update
+
     patch_winapi_com = patch("salt.utils.winapi.Com", autospec=True)
-    patch_win32com = patch("win32com.client.Dispatch", autospec=True)
+    patch_win32com = patch(
+        "win32com.client.Dispatch", autospec=True, return_value=collection
+    )
     patch_win_update_agent = patch.object(
         salt.utils.win_update.WindowsUpdateAgent, "refresh", autospec=True
     )
     patch_opts = patch.dict(win_wua.__opts__, {"test": True})
 
-    with patch_winapi_com, patch_win32com, patch_win_update_agent, patch_opts:
-        wua = win_update.WindowsUpdateAgent(online=False)
-        wua._updates = [MagicMock(IsInstalled=False, IsDownloaded=False)]
-        result = win_wua.uptodate(name="NA")
-        assert result == expected
+    with patch_winapi_com, patch_win32com, patch_win_update_agent:
+        with patch_opts:
+            result = win_wua.uptodate(name="NA")
+            assert result == expected
 
 
 @pytest.mark.skip_unless_on_windows
@@ -11,8 +11,29 @@ def kb():
 
 
 @pytest.fixture
-def configure_loader_modules():
-    return {wusa: {"__opts__": {"test": False}, "__env__": "base"}}
+def mock_installed():
+    return MagicMock(return_value=False)
+
+
+@pytest.fixture
+def mock_cache(kb):
+    return MagicMock(return_value=f"C:\\{kb}.msu")
+
+
+@pytest.fixture
+def configure_loader_modules(mock_installed, mock_cache):
+    return {
+        wusa: {
+            "__opts__": {"test": False},
+            "__env__": "base",
+            "__salt__": {
+                "wusa.is_installed": mock_installed,
+                "cp.cache_file": mock_cache,
+                "wusa.install": MagicMock(),
+                "wusa.uninstall": MagicMock(),
+            },
+        }
+    }
 
 
 def test_installed_no_source():
@@ -24,175 +45,136 @@ def test_installed_no_source():
         assert excinfo.exception.strerror == 'Must specify a "source" file to install'
 
 
-def test_installed_existing(kb):
+def test_installed_existing(kb, mock_installed):
     """
     test wusa.installed when the kb is already installed
     """
-    mock_installed = MagicMock(return_value=True)
-    with patch.dict(wusa.__salt__, {"wusa.is_installed": mock_installed}):
-        returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
-        expected = {
-            "changes": {},
-            "comment": f"{kb} already installed",
-            "name": kb,
-            "result": True,
-        }
-        assert expected == returned
+    mock_installed.return_value = True
+    returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
+    expected = {
+        "changes": {},
+        "comment": f"{kb} already installed",
+        "name": kb,
+        "result": True,
+    }
+    assert expected == returned
 
 
 def test_installed_test_true(kb):
     """
     test wusa.installed with test=True
     """
-    mock_installed = MagicMock(return_value=False)
-    with patch.dict(wusa.__salt__, {"wusa.is_installed": mock_installed}), patch.dict(
-        wusa.__opts__, {"test": True}
-    ):
+    with patch.dict(wusa.__opts__, {"test": True}):
         returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
-        expected = {
-            "changes": {},
-            "comment": f"{kb} would be installed",
-            "name": kb,
-            "result": None,
-        }
-        assert expected == returned
+    expected = {
+        "changes": {},
+        "comment": f"{kb} would be installed",
+        "name": kb,
+        "result": None,
+    }
+    assert expected == returned
 
 
-def test_installed_cache_fail(kb):
+def test_installed_cache_fail(kb, mock_cache):
     """
     test wusa.install when it fails to cache the file
     """
-    mock_installed = MagicMock(return_value=False)
-    mock_cache = MagicMock(return_value="")
-    with patch.dict(
-        wusa.__salt__,
-        {"wusa.is_installed": mock_installed, "cp.cache_file": mock_cache},
-    ):
-        returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
-        expected = {
-            "changes": {},
-            "comment": f'Unable to cache salt://{kb}.msu from saltenv "base"',
-            "name": kb,
-            "result": False,
-        }
-        assert expected == returned
+    mock_cache.return_value = ""
+    returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
+    expected = {
+        "changes": {},
+        "comment": f'Unable to cache salt://{kb}.msu from saltenv "base"',
+        "name": kb,
+        "result": False,
+    }
+    assert expected == returned
 
 
-def test_installed(kb):
+def test_installed(kb, mock_installed):
     """
     test wusa.installed assuming success
     """
-    mock_installed = MagicMock(side_effect=[False, True])
-    mock_cache = MagicMock(return_value=f"C:\\{kb}.msu")
-    with patch.dict(
-        wusa.__salt__,
-        {
-            "wusa.is_installed": mock_installed,
-            "cp.cache_file": mock_cache,
-            "wusa.install": MagicMock(),
-        },
-    ):
-        returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
-        expected = {
-            "changes": {"new": True, "old": False},
-            "comment": f"{kb} was installed. ",
-            "name": kb,
-            "result": True,
-        }
-        assert expected == returned
+    mock_installed.side_effect = [False, True]
+    returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
+    expected = {
+        "changes": {"new": True, "old": False},
+        "comment": f"{kb} was installed. ",
+        "name": kb,
+        "result": True,
+    }
+    assert expected == returned
 
 
-def test_installed_failed(kb):
+def test_installed_failed(kb, mock_installed):
     """
     test wusa.installed with a failure
     """
-    mock_installed = MagicMock(side_effect=[False, False])
-    mock_cache = MagicMock(return_value=f"C:\\{kb}.msu")
-    with patch.dict(
-        wusa.__salt__,
-        {
-            "wusa.is_installed": mock_installed,
-            "cp.cache_file": mock_cache,
-            "wusa.install": MagicMock(),
-        },
-    ):
-        returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
-        expected = {
-            "changes": {},
-            "comment": f"{kb} failed to install. ",
-            "name": kb,
-            "result": False,
-        }
-        assert expected == returned
+    mock_installed.side_effect = [False, False]
+    returned = wusa.installed(name=kb, source=f"salt://{kb}.msu")
+    expected = {
+        "changes": {},
+        "comment": f"{kb} failed to install. ",
+        "name": kb,
+        "result": False,
+    }
+    assert expected == returned
 
 
 def test_uninstalled_non_existing(kb):
     """
     test wusa.uninstalled when the kb is not installed
     """
-    mock_installed = MagicMock(return_value=False)
-    with patch.dict(wusa.__salt__, {"wusa.is_installed": mock_installed}):
-        returned = wusa.uninstalled(name=kb)
-        expected = {
-            "changes": {},
-            "comment": f"{kb} already uninstalled",
-            "name": kb,
-            "result": True,
-        }
-        assert expected == returned
+    returned = wusa.uninstalled(name=kb)
+    expected = {
+        "changes": {},
+        "comment": f"{kb} already uninstalled",
+        "name": kb,
+        "result": True,
+    }
+    assert expected == returned
 
 
-def test_uninstalled_test_true(kb):
+def test_uninstalled_test_true(kb, mock_installed):
     """
     test wusa.uninstalled with test=True
     """
-    mock_installed = MagicMock(return_value=True)
-    with patch.dict(wusa.__salt__, {"wusa.is_installed": mock_installed}), patch.dict(
-        wusa.__opts__, {"test": True}
-    ):
+    mock_installed.return_value = True
+    with patch.dict(wusa.__opts__, {"test": True}):
         returned = wusa.uninstalled(name=kb)
-        expected = {
-            "changes": {},
-            "comment": f"{kb} would be uninstalled",
-            "name": kb,
-            "result": None,
-        }
-        assert expected == returned
+    expected = {
+        "changes": {},
+        "comment": f"{kb} would be uninstalled",
+        "name": kb,
+        "result": None,
+    }
+    assert expected == returned
 
 
-def test_uninstalled(kb):
+def test_uninstalled(kb, mock_installed):
     """
     test wusa.uninstalled assuming success
     """
-    mock_installed = MagicMock(side_effect=[True, False])
-    with patch.dict(
-        wusa.__salt__,
-        {"wusa.is_installed": mock_installed, "wusa.uninstall": MagicMock()},
-    ):
-        returned = wusa.uninstalled(name=kb)
-        expected = {
-            "changes": {"new": False, "old": True},
-            "comment": f"{kb} was uninstalled",
-            "name": kb,
-            "result": True,
-        }
-        assert expected == returned
+    mock_installed.side_effect = [True, False]
+    returned = wusa.uninstalled(name=kb)
+    expected = {
+        "changes": {"new": False, "old": True},
+        "comment": f"{kb} was uninstalled",
+        "name": kb,
+        "result": True,
+    }
+    assert expected == returned
 
 
-def test_uninstalled_failed(kb):
+def test_uninstalled_failed(kb, mock_installed):
     """
     test wusa.uninstalled with a failure
     """
-    mock_installed = MagicMock(side_effect=[True, True])
-    with patch.dict(
-        wusa.__salt__,
-        {"wusa.is_installed": mock_installed, "wusa.uninstall": MagicMock()},
-    ):
-        returned = wusa.uninstalled(name=kb)
-        expected = {
-            "changes": {},
-            "comment": f"{kb} failed to uninstall",
-            "name": kb,
-            "result": False,
-        }
-        assert expected == returned
+    mock_installed.side_effect = [True, True]
+    returned = wusa.uninstalled(name=kb)
+    expected = {
+        "changes": {},
+        "comment": f"{kb} failed to uninstall",
+        "name": kb,
+        "result": False,
+    }
+    assert expected == returned
@@ -1,7 +1,13 @@
+import subprocess
+import sys
+import threading
+import time
+
 import pytest
 
 import salt.utils.win_update as win_update
-from tests.support.mock import MagicMock, patch
+from salt.exceptions import CommandExecutionError
+from tests.support.mock import MagicMock, PropertyMock, patch
 
 pytestmark = [
     pytest.mark.windows_whitelisted,
@@ -9,6 +15,32 @@ pytestmark = [
 ]
 
 
+def _collection(items):
+    """
+    Fake a COM collection that is accessed by index
+    """
+    collection = MagicMock(Count=len(items))
+    collection.Item.side_effect = items.__getitem__
+    return collection
+
+
+def test_updates():
+    """
+    Test updates wraps the collection of all updates without copying it
+    """
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        wua._updates = _collection([MagicMock(), MagicMock()])
+
+        updates = wua.updates()
+
+    assert updates.updates is wua._updates
+    assert updates.count() == 2
+    wua._updates.Add.assert_not_called()
+
+
 def test_installed_no_updates():
     """
     Test installed when there are no updates on the system
@@ -17,70 +49,1082 @@ def test_installed_no_updates():
         "win32com.client.Dispatch", autospec=True
     ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
         wua = win_update.WindowsUpdateAgent(online=False)
-        wua._updates = []
+        wua._updates = _collection([])
 
-        installed_updates = wua.installed()
+        with patch.object(wua, "_search") as mock_search:
+            installed_updates = wua.installed()
 
+        mock_search.assert_not_called()
         assert installed_updates.updates.Add.call_count == 0
 
 
-def test_installed_no_updates_installed():
+def test_installed_updates():
     """
-    Test installed when there are no Installed updates on the system
+    Test installed returns the installed updates found by refresh
     """
     with patch("salt.utils.winapi.Com", autospec=True), patch(
         "win32com.client.Dispatch", autospec=True
     ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
         wua = win_update.WindowsUpdateAgent(online=False)
+        installed = [MagicMock(IsInstalled=True), MagicMock(IsInstalled=True)]
+        wua._updates = _collection(installed + [MagicMock(IsInstalled=False)])
 
-        wua._updates = [
-            MagicMock(IsInstalled=False),
-            MagicMock(IsInstalled=False),
-            MagicMock(IsInstalled=False),
+        with patch.object(wua, "_search") as mock_search:
+            installed_updates = wua.installed()
+
+        mock_search.assert_not_called()
+        assert installed_updates.updates.Add.call_args_list == [
+            ((update,),) for update in installed
         ]
 
-        installed_updates = wua.installed()
 
-        assert installed_updates.updates.Add.call_count == 0
+def _update(**kwargs):
+    """
+    Fake an update that is available, i.e. neither hidden nor installed
+    """
+    kwargs.setdefault("IsHidden", False)
+    kwargs.setdefault("IsInstalled", False)
+    kwargs.setdefault("Type", 1)
+    return MagicMock(**kwargs)
 
 
-def test_installed_updates_all_installed():
+@pytest.mark.parametrize(
+    "kwargs,expected",
+    (
+        ({}, ["software", "driver"]),
+        (
+            {"skip_hidden": False, "skip_installed": False},
+            ["software", "driver", "hidden", "installed"],
+        ),
+        ({"skip_hidden": False}, ["software", "driver", "hidden"]),
+        ({"drivers": False}, ["software"]),
+        ({"software": False}, ["driver"]),
+    ),
+)
+def test_available_defaults(kwargs, expected):
     """
-    Test installed when all updates on the system are Installed
+    Test available filters the updates found by refresh without searching
+    again
     """
+    updates = {
+        "software": _update(),
+        "driver": _update(Type=2),
+        "hidden": _update(IsHidden=True),
+        "installed": _update(IsInstalled=True),
+    }
     with patch("salt.utils.winapi.Com", autospec=True), patch(
         "win32com.client.Dispatch", autospec=True
     ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
         wua = win_update.WindowsUpdateAgent(online=False)
+        wua._updates = _collection(list(updates.values()))
 
-        wua._updates = [
-            MagicMock(IsInstalled=True),
-            MagicMock(IsInstalled=True),
-            MagicMock(IsInstalled=True),
+        with patch.object(wua, "_search") as mock_search:
+            available_updates = wua.available(**kwargs)
+
+        mock_search.assert_not_called()
+        assert available_updates.updates.Add.call_args_list == [
+            ((updates[name],),) for name in expected
         ]
 
-        installed_updates = wua.installed()
 
-        assert installed_updates.updates.Add.call_count == 3
+def test_available_no_types():
+    """
+    Test available returns nothing if neither software nor drivers are
+    requested
+    """
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        wua._updates = _collection([_update(), _update(Type=2)])
+
+        available_updates = wua.available(software=False, drivers=False)
+
+        assert available_updates.updates.Add.call_count == 0
 
 
-def test_installed_updates_some_installed():
+@pytest.mark.parametrize(
+    "search_string,expected",
+    (
+        ("12345678-abcd-1234-abcd-1234567890ab", [0]),
+        ("KB123456", [0]),
+        (123456, [0]),
+        (["KB123456", "654321"], [0, 1]),
+        ("Update for", [1]),
+        ("nothing", []),
+    ),
+)
+def test_search(search_string, expected):
     """
-    Test installed when some updates are installed on the system
+    Test search finds updates by GUID, KB or Title
     """
+    first = MagicMock(KBArticleIDs=["123456"], Title="Security Update")
+    first.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    second = MagicMock(KBArticleIDs=["654321"], Title="Update for Windows")
+    second.Identity.UpdateID = "87654321-abcd-1234-abcd-1234567890ab"
+    updates = [first, second]
     with patch("salt.utils.winapi.Com", autospec=True), patch(
         "win32com.client.Dispatch", autospec=True
     ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
         wua = win_update.WindowsUpdateAgent(online=False)
+        wua._updates = _collection(updates)
 
-        wua._updates = [
-            MagicMock(IsInstalled=True),
-            MagicMock(IsInstalled=False),
-            MagicMock(IsInstalled=True),
-            MagicMock(IsInstalled=False),
-            MagicMock(IsInstalled=True),
-        ]
+        found = wua.search(search_string)
+
+    assert found.updates.Add.call_args_list == [
+        ((updates[index],),) for index in expected
+    ]
+
+
+def test_search_adds_update_once():
+    """
+    Test search adds an update only once when it matches several terms
+    """
+    update = MagicMock(KBArticleIDs=["123456"], Title="Security Update")
+    update.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        wua._updates = _collection([update])
+
+        found = wua.search(
+            ["12345678-abcd-1234-abcd-1234567890ab", "KB123456", "Security"]
+        )
+
+    found.updates.Add.assert_called_once_with(update)
+
+
+def test_search_cached():
+    """
+    Test _search only queries WUA once per criteria
+    """
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        wua._session = MagicMock()
+        searcher = wua._session.CreateUpdateSearcher.return_value
+
+        first = wua._search("IsInstalled=1")
+        second = wua._search("IsInstalled=1")
+        wua._search("IsInstalled=0")
+
+        assert first is second
+        assert searcher.Search.call_count == 2
+        assert searcher.Online is False
+
+
+def test_context_cache():
+    """
+    Test the session and updates cached in the context are reused by the next
+    agent
+    """
+    context = {}
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        wua = win_update.WindowsUpdateAgent(online=False, context=context)
+        wua._session.CreateUpdateSearcher.return_value.Search.assert_called_once()
+        cached = context["win_update.agent"]
+        assert cached["updates"] is wua._updates
+
+        with patch.object(
+            win_update.WindowsUpdateAgent, "refresh", autospec=True
+        ) as mock_refresh:
+            second = win_update.WindowsUpdateAgent(online=False, context=context)
+            mock_refresh.assert_not_called()
+            assert second._updates is wua._updates
+            assert second._search_cache is wua._search_cache
+
+            # A search that went online is needed
+            win_update.WindowsUpdateAgent(online=True, context=context)
+            mock_refresh.assert_called_once()
+
+
+def test_context_cache_expired():
+    """
+    Test the cached session is not reused after the TTL
+    """
+    context = {}
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        win_update.WindowsUpdateAgent(online=False, context=context)
+        context["win_update.agent"]["stamp"] -= win_update.CONTEXT_TTL
+
+        with patch.object(
+            win_update.WindowsUpdateAgent, "refresh", autospec=True
+        ) as mock_refresh:
+            win_update.WindowsUpdateAgent(online=False, context=context)
+            mock_refresh.assert_called_once()
+
+
+def test_context_cache_other_thread():
+    """
+    Test the cached session is not reused by another thread, even once the
+    thread that cached it has exited
+    """
+    context = {}
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        thread = threading.Thread(
+            target=win_update.WindowsUpdateAgent,
+            kwargs={"online": False, "context": context},
+        )
+        thread.start()
+        thread.join()
+        assert context["win_update.agent"]["thread"]() is thread
+
+        with patch.object(
+            win_update.WindowsUpdateAgent, "refresh", autospec=True
+        ) as mock_refresh:
+            win_update.WindowsUpdateAgent(online=False, context=context)
+            mock_refresh.assert_called_once()
+
+
+def test_context_cache_invalidated_by_download():
+    """
+    Test downloading updates clears the cached session
+    """
+    context = {}
+    update = MagicMock(IsDownloaded=False, EulaAccepted=True)
+    update.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    download_list = MagicMock(Count=1)
+    download_list.Item.return_value = update
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        wua = win_update.WindowsUpdateAgent(online=False, context=context)
+        updates = win_update.Updates()
+        updates.updates = _collection([update])
+        result = wua._session.CreateUpdateDownloader.return_value.Download.return_value
+        result.ResultCode = 2
+        result.GetUpdateResult.return_value.ResultCode = 2
+
+        with patch.object(win_update, "_dispatch", return_value=download_list):
+            ret = wua.download(updates)
+
+    assert ret["Success"] is True
+    assert "win_update.agent" not in context
+    assert wua._search_cache == {}
+
+
+def test_install():
+    """
+    Test install reports the result of each update it installed
+    """
+    installed = MagicMock(IsInstalled=True, Title="Installed Update")
+    installed.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    pending = MagicMock(IsInstalled=False, Title="Pending Update")
+    pending.Identity.UpdateID = "87654321-abcd-1234-abcd-1234567890ab"
+    pending.InstallationBehavior.RebootBehavior = 1
+    install_list = MagicMock(Count=1)
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        updates = win_update.Updates()
+        updates.updates = _collection([installed, pending])
+        result = wua._session.CreateUpdateInstaller.return_value.Install.return_value
+        result.ResultCode = 2
+        result.RebootRequired = True
+        result.GetUpdateResult.return_value.ResultCode = 2
+
+        with patch.object(win_update, "_dispatch", return_value=install_list):
+            ret = wua.install(updates)
+
+    install_list.Add.assert_called_once_with(pending)
+    install_list.Item.assert_not_called()
+    assert ret == {
+        "Success": True,
+        "Message": "Installation Succeeded",
+        "NeedsReboot": True,
+        "Updates": {
+            "12345678-abcd-1234-abcd-1234567890ab": {
+                "Title": "Installed Update",
+                "AlreadyInstalled": True,
+            },
+            "87654321-abcd-1234-abcd-1234567890ab": {
+                "Title": "Pending Update",
+                "AlreadyInstalled": False,
+                "Result": "Installation Succeeded",
+                "RebootBehavior": "Always Requires Reboot",
+            },
+        },
+    }
+
+
+def test_install_reboot_behavior_error():
+    """
+    Test install defaults the reboot behavior if it can't be read
+    """
+    pending = MagicMock(IsInstalled=False, Title="Pending Update")
+    pending.Identity.UpdateID = "87654321-abcd-1234-abcd-1234567890ab"
+    del pending.InstallationBehavior.RebootBehavior
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        updates = win_update.Updates()
+        updates.updates = _collection([pending])
+        result = wua._session.CreateUpdateInstaller.return_value.Install.return_value
+        result.ResultCode = 2
+        result.GetUpdateResult.return_value.ResultCode = 2
+
+        with patch.object(win_update, "_dispatch", return_value=MagicMock(Count=1)):
+            ret = wua.install(updates)
+
+    assert ret["Updates"]["87654321-abcd-1234-abcd-1234567890ab"]["RebootBehavior"] == (
+        "Can Require Reboot"
+    )
+
+
+def test__dispatch_early_bound():
+    """
+    Test _dispatch uses the early-bound wrapper when it is available
+    """
+    with patch("win32com.client.gencache.EnsureDispatch") as mock_ensure, patch(
+        "win32com.client.Dispatch", autospec=True
+    ) as mock_dispatch:
+        result = win_update._dispatch("Microsoft.Update.UpdateColl")
+
+        mock_ensure.assert_called_once_with("Microsoft.Update.UpdateColl")
+        mock_dispatch.assert_not_called()
+        assert result == mock_ensure.return_value
+
+
+def test__dispatch_late_bound_fallback():
+    """
+    Test _dispatch falls back to a late-bound object if the early-bound wrapper
+    can't be generated
+    """
+    with patch("win32com.client.gencache.EnsureDispatch", side_effect=TypeError), patch(
+        "win32com.client.Dispatch", autospec=True
+    ) as mock_dispatch:
+        result = win_update._dispatch("Microsoft.Update.UpdateColl")
+
+        mock_dispatch.assert_called_once_with("Microsoft.Update.UpdateColl")
+        assert result == mock_dispatch.return_value
+
+
+def test__com_error_code_pywin32():
+    """
+    Test _com_error_code reads the code from the exception info of a pywin32
+    error, or falls back to its HRESULT
+    """
+    error = win_update.pywintypes.com_error(
+        -2147352567,
+        "Exception occurred.",
+        (0, None, None, None, 0, -2145124316),
+        None,
+    )
+    assert win_update._com_error_code(error) == -2145124316
+    error = win_update.pywintypes.com_error(-2147221005, "Invalid class", None, None)
+    assert win_update._com_error_code(error) == -2147221005
+
+
+def test__translate_com_error():
+    """
+    Test _translate_com_error looks up known error codes and reports unknown
+    ones
+    """
+    error = win_update.pywintypes.com_error(
+        -2147352567,
+        "Exception occurred.",
+        (0, None, None, None, 0, -2145124316),
+        None,
+    )
+    unknown = win_update.pywintypes.com_error(-2147221005, "Invalid class", None, None)
+    fail_codes = win_update.WindowsUpdateAgent.fail_codes
+    assert (
+        win_update._translate_com_error(error, fail_codes) == "No Updates: 0x80240024"
+    )
+    assert win_update._translate_com_error(unknown, fail_codes) == (
+        f"Unknown Failure: {unknown}"
+    )
+
+
+def test_search_error():
+    """
+    Test a failed search raises a CommandExecutionError with the translated
+    error
+    """
+    error = win_update.pywintypes.com_error(
+        -2147352567,
+        "Exception occurred.",
+        (0, None, None, None, 0, -2145124302),
+        None,
+    )
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        wua._session = MagicMock()
+        searcher = wua._session.CreateUpdateSearcher.return_value
+        searcher.Search.side_effect = error
+
+        with pytest.raises(CommandExecutionError) as exc_info:
+            wua._search("IsInstalled=2")
+
+    assert str(exc_info.value) == "Invalid search criteria: 0x80240032"
+
+
+def test__init_com_once_per_thread():
+    """
+    Test _init_com initializes COM only once per thread
+    """
+    with patch.object(win_update, "_COM_THREAD", threading.local()), patch.object(
+        win_update, "pythoncom", create=True
+    ) as mock_pythoncom:
+        win_update._init_com()
+        win_update._init_com()
+        mock_pythoncom.CoInitializeEx.assert_called_once_with(
+            mock_pythoncom.COINIT_APARTMENTTHREADED
+        )
+
+        thread = threading.Thread(target=win_update._init_com)
+        thread.start()
+        thread.join()
+        assert mock_pythoncom.CoInitializeEx.call_count == 2
+
+
+def test__init_com_changed_mode():
+    """
+    Test _init_com accepts threads that already joined another apartment
+    """
+    changed_mode = win_update.pywintypes.com_error(
+        win_update.RPC_E_CHANGED_MODE, "Cannot change thread mode", None, None
+    )
+    failed = win_update.pywintypes.com_error(-2147467259, "Unspecified", None, None)
+    with patch.object(win_update, "pythoncom", create=True) as mock_pythoncom:
+        with patch.object(win_update, "_COM_THREAD", threading.local()):
+            mock_pythoncom.CoInitializeEx.side_effect = changed_mode
+            win_update._init_com()
+            assert win_update._COM_THREAD.initialized is True
+
+        with patch.object(win_update, "_COM_THREAD", threading.local()):
+            mock_pythoncom.CoInitializeEx.side_effect = failed
+            with pytest.raises(win_update.pywintypes.com_error):
+                win_update._init_com()
+            assert not hasattr(win_update._COM_THREAD, "initialized")
+
+
+def _category(name):
+    category = MagicMock()
+    category.Name = name
+    return category
+
+
+def test_summary():
+    """
+    Test summary counts the updates in the collection
+    """
+    updates = [
+        MagicMock(
+            IsDownloaded=False,
+            IsInstalled=False,
+            MsrcSeverity="Critical",
+            Categories=[_category("Security Updates"), _category("Updates")],
+        ),
+        MagicMock(
+            IsDownloaded=True,
+            IsInstalled=False,
+            MsrcSeverity="",
+            Categories=[_category("Updates")],
+        ),
+        MagicMock(
+            IsDownloaded=True,
+            IsInstalled=True,
+            MsrcSeverity="Critical",
+            Categories=[_category("Security Updates")],
+        ),
+    ]
+    for update in updates:
+        update.Type = 1
+        update.KBArticleIDs = []
+        update.InstallationBehavior.RebootBehavior = 0
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        collection = win_update.Updates()
+        collection.updates = _collection(updates)
 
-        installed_updates = wua.installed()
+        result = collection.summary()
 
-        assert installed_updates.updates.Add.call_count == 3
+    assert result == {
+        "Total": 3,
+        "Available": 1,
+        "Downloaded": 1,
+        "Installed": 1,
+        "Categories": {"Security Updates": 2, "Updates": 2},
+        "Severity": {"Critical": 2},
+    }
+
+
+def test_list():
+    """
+    Test list returns the details of the updates in the collection
+    """
+    update = MagicMock(
+        Title="Security Update",
+        Type=1,
+        Description="A security update",
+        IsDownloaded=True,
+        IsInstalled=False,
+        IsMandatory=False,
+        EulaAccepted=True,
+        RebootRequired=False,
+        MsrcSeverity="Critical",
+        KBArticleIDs=["123456"],
+        Categories=[_category("Security Updates")],
+        SupportUrl="https://support.microsoft.com",
+    )
+    update.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    update.InstallationBehavior.CanRequestUserInput = False
+    update.InstallationBehavior.RebootBehavior = 1
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        collection = win_update.Updates()
+        collection.updates = _collection([update])
+
+        result = collection.list()
+
+    assert result == {
+        "12345678-abcd-1234-abcd-1234567890ab": {
+            "guid": "12345678-abcd-1234-abcd-1234567890ab",
+            "Title": "Security Update",
+            "Type": "Software",
+            "Description": "A security update",
+            "Downloaded": True,
+            "Installed": False,
+            "Mandatory": False,
+            "EULAAccepted": True,
+            "NeedsReboot": False,
+            "Severity": "Critical",
+            "UserInput": False,
+            "RebootBehavior": "Always Requires Reboot",
+            "KBs": ["KB123456"],
+            "Categories": ["Security Updates"],
+            "SupportUrl": "https://support.microsoft.com",
+        }
+    }
+
+
+def test_list_and_summary_read_updates_once():
+    """
+    Test list and summary share the details read from the collection
+    """
+    update = MagicMock(
+        Type=1,
+        IsDownloaded=False,
+        IsInstalled=False,
+        MsrcSeverity=None,
+        KBArticleIDs=["123456"],
+        Categories=[_category("Updates")],
+    )
+    update.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    update.InstallationBehavior.RebootBehavior = 0
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        collection = win_update.Updates()
+        collection.updates = _collection([update])
+
+        details = collection.list()
+        summary = collection.summary()
+
+    collection.updates.Item.assert_called_once_with(0)
+    assert details["12345678-abcd-1234-abcd-1234567890ab"]["Severity"] == "None"
+    assert summary["Available"] == 1
+    assert summary["Categories"] == {"Updates": 1}
+    assert summary["Severity"] == {}
+
+
+@pytest.mark.parametrize("missing", ("", "CanRequestUserInput", "RebootBehavior"))
+def test_list_installation_behavior_error(missing):
+    """
+    Test list falls back to defaults when InstallationBehavior, or one of its
+    properties, can't be read
+    """
+    update = MagicMock(Type=1, KBArticleIDs=[], Categories=[])
+    update.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    if missing:
+        delattr(update.InstallationBehavior, missing)
+    else:
+        del update.InstallationBehavior
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ):
+        collection = win_update.Updates()
+        collection.updates = _collection([update])
+
+        result = collection.list()
+
+    details = result["12345678-abcd-1234-abcd-1234567890ab"]
+    assert details["UserInput"] is False
+    assert details["RebootBehavior"] == "Can Require Reboot"
+
+
+def test_available_skip_reboot():
+    """
+    Test available skips updates that require a reboot, or whose reboot
+    behavior can't be read
+    """
+    never = _update(IsMandatory=False)
+    never.InstallationBehavior.RebootBehavior = 0
+    always = _update(IsMandatory=False)
+    always.InstallationBehavior.RebootBehavior = 1
+    unknown = _update(IsMandatory=False)
+    del unknown.InstallationBehavior
+    unreadable = _update(IsMandatory=False)
+    del unreadable.InstallationBehavior.RebootBehavior
+    found = _collection([never, always, unknown, unreadable])
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+
+        wua._updates = found
+        available_updates = wua.available(skip_reboot=True)
+
+    available_updates.updates.Add.assert_called_once_with(never)
+
+
+def test_available_filters():
+    """
+    Test available only keeps updates matching the mandatory, category and
+    severity filters
+    """
+    wanted = _update(
+        IsMandatory=False,
+        MsrcSeverity="Critical",
+        Categories=[_category("Drivers"), _category("Security Updates")],
+    )
+    mandatory = _update(
+        IsMandatory=True,
+        MsrcSeverity="Critical",
+        Categories=[_category("Security Updates")],
+    )
+    other_category = _update(
+        IsMandatory=False, MsrcSeverity="Critical", Categories=[_category("Drivers")]
+    )
+    other_severity = _update(
+        IsMandatory=False,
+        MsrcSeverity="Low",
+        Categories=[_category("Security Updates")],
+    )
+    found = _collection([wanted, mandatory, other_category, other_severity])
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+
+        wua._updates = found
+        available_updates = wua.available(
+            skip_mandatory=True,
+            skip_reboot=False,
+            categories=["Security Updates"],
+            severities=["Critical"],
+        )
+
+    available_updates.updates.Add.assert_called_once_with(wanted)
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    (
+        (0, "Never Requires Reboot"),
+        (1, "Always Requires Reboot"),
+        (2, "Can Require Reboot"),
+        (3, "Can Require Reboot"),
+        (-1, "Never Requires Reboot"),
+    ),
+)
+def test__reboot_behavior(value, expected):
+    """
+    Test _reboot_behavior clamps unknown values to a known behavior
+    """
+    assert win_update._reboot_behavior(value) == expected
+
+
+DISM_PACKAGES = """
+Deployment Image Servicing and Management tool
+Version: 10.0.19041.844
+
+Image Version: 10.0.19045.3803
+
+Packages listing:
+
+Package Identity : Package_for_KB4052623~31bf3856ad364e35~amd64~~4.18.1.0
+State : Installed
+Release Type : Update
+Install Time : 1/1/2024 12:00 AM
+
+Package Identity : Package_for_KB40526230~31bf3856ad364e35~amd64~~1.0.0.0
+State : Installed
+Release Type : Update
+Install Time : 1/1/2024 12:00 AM
+
+The operation completed successfully.
+"""
+
+
+def _uninstall_dism(updates, refreshed, dism_output):
+    """
+    Uninstall ``updates`` with WUA refusing to, so DISM is used. ``refreshed``
+    are the updates found after the uninstall.
+    """
+    not_allowed = win_update.pywintypes.com_error(
+        -2147352567,
+        "Exception occurred.",
+        (0, None, None, None, 0, -2145124312),
+        None,
+    )
+    mock_run_lines = MagicMock(return_value=iter(dism_output.splitlines(True)))
+    mock_run = MagicMock(return_value=(None, None))
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(
+        win_update.WindowsUpdateAgent, "refresh", autospec=True
+    ), patch.object(
+        win_update, "needs_reboot", return_value=False
+    ):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        wua._updates = _collection(refreshed)
+        wua._run_lines = mock_run_lines
+        wua._run = mock_run
+        installer = wua._session.CreateUpdateInstaller.return_value
+        installer.Uninstall.side_effect = not_allowed
+        collection = win_update.Updates()
+        collection.updates = _collection(updates)
+
+        with patch.object(win_update, "_dispatch", return_value=_collection(updates)):
+            ret = wua.uninstall(collection)
+
+    mock_run_lines.assert_called_once_with(["dism", "/Online", "/Get-Packages"])
+    return ret, mock_run
+
+
+@pytest.mark.parametrize("kb", ["4052623", "KB4052623", "kb4052623"])
+def test_uninstall_dism(kb):
+    """
+    Test uninstall falls back to DISM when WUA doesn't allow the uninstall
+    """
+    update = MagicMock(IsInstalled=True, Title="Update", KBArticleIDs=[kb])
+    update.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+    update.UninstallationBehavior.RebootBehavior = 0
+    uninstalled = MagicMock(IsInstalled=False)
+    uninstalled.Identity.UpdateID = "12345678-abcd-1234-abcd-1234567890ab"
+
+    ret, mock_run = _uninstall_dism([update], [uninstalled], DISM_PACKAGES)
+
+    assert mock_run.call_args_list == [
+        (
+            (
+                [
+                    "dism",
+                    "/Online",
+                    "/Remove-Package",
+                    "/PackageName:Package_for_KB4052623~31bf3856ad364e35~amd64~~4.18.1.0",
+                    "/Quiet",
+                    "/NoRestart",
+                ],
+            ),
+            {"capture": False, "timeout": None},
+        ),
+    ]
+    assert ret["Success"] is True
+    assert ret["Message"] == "Uninstalled using DISM"
+    assert ret["Updates"]["12345678-abcd-1234-abcd-1234567890ab"]["Result"] == (
+        "Uninstallation Succeeded"
+    )
+    assert ret["Updates"]["12345678-abcd-1234-abcd-1234567890ab"]["RebootBehavior"] == (
+        "Never Requires Reboot"
+    )
+
+
+def test_uninstall_dism_batches():
+    """
+    Test the DISM fallback removes the packages of all updates in batches
+    """
+    dism_output = "\n".join(
+        f"Package Identity : Package_for_KB{kb}~31bf3856ad364e35~amd64~~1.0"
+        for kb in range(3)
+    )
+    updates = []
+    for kb in range(3):
+        update = MagicMock(IsInstalled=True, KBArticleIDs=[str(kb)])
+        update.Identity.UpdateID = f"update-{kb}"
+        updates.append(update)
+
+    with patch.object(win_update, "DISM_BATCH_SIZE", 2):
+        _, mock_run = _uninstall_dism(updates, [], dism_output)
+
+    assert [call[0][0] for call in mock_run.call_args_list] == [
+        [
+            "dism",
+            "/Online",
+            "/Remove-Package",
+            "/PackageName:Package_for_KB0~31bf3856ad364e35~amd64~~1.0",
+            "/PackageName:Package_for_KB1~31bf3856ad364e35~amd64~~1.0",
+            "/Quiet",
+            "/NoRestart",
+        ],
+        [
+            "dism",
+            "/Online",
+            "/Remove-Package",
+            "/PackageName:Package_for_KB2~31bf3856ad364e35~amd64~~1.0",
+            "/Quiet",
+            "/NoRestart",
+        ],
+    ]
+
+
+def test_uninstall():
+    """
+    Test the reboot behavior of uninstalling is read once per update
+    """
+    behavior = MagicMock()
+    reboot_behavior = PropertyMock(return_value=1)
+    type(behavior).RebootBehavior = reboot_behavior
+    update = MagicMock(
+        IsInstalled=True, Title="Update", UninstallationBehavior=behavior
+    )
+    update.Identity.UpdateID = "update-1"
+    broken = MagicMock(
+        IsInstalled=True, Title="Broken", spec=["IsInstalled", "Title", "Identity"]
+    )
+    broken.Identity.UpdateID = "update-2"
+    unreadable = MagicMock(IsInstalled=True, Title="Unreadable")
+    unreadable.Identity.UpdateID = "update-3"
+    del unreadable.UninstallationBehavior.RebootBehavior
+    updates = [update, broken, unreadable]
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        result = wua._session.CreateUpdateInstaller.return_value.Uninstall.return_value
+        result.ResultCode = 2
+        result.RebootRequired = False
+        result.GetUpdateResult.return_value.ResultCode = 2
+        collection = win_update.Updates()
+        collection.updates = _collection(updates)
+
+        with patch.object(win_update, "_dispatch", return_value=_collection(updates)):
+            ret = wua.uninstall(collection)
+
+    assert ret["Success"] is True
+    assert ret["Updates"]["update-1"]["RebootBehavior"] == "Always Requires Reboot"
+    assert ret["Updates"]["update-2"]["RebootBehavior"] == "Can Require Reboot"
+    assert ret["Updates"]["update-3"]["RebootBehavior"] == "Can Require Reboot"
+    reboot_behavior.assert_called_once_with()
+
+
+def test_uninstall_dism_shared_kb():
+    """
+    Test the DISM fallback removes the package of a KB shared by several
+    updates once
+    """
+    updates = []
+    for index, kbs in enumerate((["4052623"], ["KB4052623", "1234567"])):
+        update = MagicMock(IsInstalled=True, KBArticleIDs=kbs)
+        update.Identity.UpdateID = f"update-{index}"
+        updates.append(update)
+
+    _, mock_run = _uninstall_dism(updates, [], DISM_PACKAGES)
+
+    mock_run.assert_called_once_with(
+        [
+            "dism",
+            "/Online",
+            "/Remove-Package",
+            "/PackageName:Package_for_KB4052623~31bf3856ad364e35~amd64~~4.18.1.0",
+            "/Quiet",
+            "/NoRestart",
+        ],
+        capture=False,
+        timeout=None,
+    )
+
+
+def test_uninstall_dism_results():
+    """
+    Test the DISM fallback reports the status of the uninstalled updates only
+    """
+    updates = []
+    for kb in range(2):
+        update = MagicMock(IsInstalled=True, KBArticleIDs=[str(kb)])
+        update.Identity.UpdateID = f"update-{kb}"
+        update.UninstallationBehavior.RebootBehavior = 0
+        updates.append(update)
+    refreshed = []
+    for uid, installed in (("other", False), ("update-0", False), ("update-1", True)):
+        update = MagicMock(IsInstalled=installed)
+        update.Identity.UpdateID = uid
+        refreshed.append(update)
+
+    ret, _ = _uninstall_dism(updates, refreshed, DISM_PACKAGES)
+
+    assert "other" not in ret["Updates"]
+    assert ret["Updates"]["update-0"]["Result"] == "Uninstallation Succeeded"
+    assert ret["Updates"]["update-1"]["Result"] == "Uninstallation Failed"
+
+
+def test_uninstall_already_uninstalled():
+    """
+    Test updates that are already uninstalled are only reported
+    """
+    is_installed = PropertyMock(return_value=False)
+    removed = MagicMock(Title="Removed", spec=["Title", "Identity"])
+    type(removed).IsInstalled = is_installed
+    removed.Identity.UpdateID = "update-1"
+    update = MagicMock(IsInstalled=True, Title="Update")
+    update.Identity.UpdateID = "update-2"
+    update.UninstallationBehavior.RebootBehavior = 0
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        wua = win_update.WindowsUpdateAgent(online=False)
+        result = wua._session.CreateUpdateInstaller.return_value.Uninstall.return_value
+        result.ResultCode = 2
+        result.GetUpdateResult.return_value.ResultCode = 2
+        collection = win_update.Updates()
+        collection.updates = _collection([removed, update])
+        uninstall_list = MagicMock(Count=1)
+
+        with patch.object(win_update, "_dispatch", return_value=uninstall_list):
+            ret = wua.uninstall(collection)
+
+    assert ret["Updates"]["update-1"] == {
+        "Title": "Removed",
+        "AlreadyUninstalled": True,
+    }
+    assert ret["Updates"]["update-2"]["AlreadyUninstalled"] is False
+    is_installed.assert_called_once_with()
+    uninstall_list.Add.assert_called_once_with(update)
+
+
+def _agent():
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", autospec=True
+    ), patch.object(win_update.WindowsUpdateAgent, "refresh", autospec=True):
+        return win_update.WindowsUpdateAgent(online=False)
+
+
+def test_run():
+    """
+    Test _run captures the output of the command
+    """
+    wua = _agent()
+    mock_run = MagicMock(return_value=MagicMock(stdout=b"out", stderr=b"err"))
+    with patch("subprocess.run", mock_run):
+        assert wua._run("dism /Online /Get-Packages") == (b"out", b"err")
+    mock_run.assert_called_once_with(
+        ["dism", "/Online", "/Get-Packages"],
+        check=False,
+        timeout=300,
+        capture_output=True,
+    )
+
+
+def test_run_no_capture():
+    """
+    Test _run discards the output of the command when not capturing it
+    """
+    wua = _agent()
+    mock_run = MagicMock(return_value=MagicMock(stdout=None, stderr=None))
+    with patch("subprocess.run", mock_run):
+        assert wua._run(["dism"], capture=False, timeout=10) == (None, None)
+    mock_run.assert_called_once_with(
+        ["dism"],
+        check=False,
+        timeout=10,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def test_run_timeout():
+    """
+    Test _run raises an error when the command times out
+    """
+    wua = _agent()
+    mock_run = MagicMock(side_effect=subprocess.TimeoutExpired(["dism"], 300))
+    with patch("subprocess.run", mock_run):
+        with pytest.raises(CommandExecutionError, match="timed out after 300"):
+            wua._run(["dism"])
+
+
+def test_needs_reboot_cached():
+    """
+    Test needs_reboot reuses its result until it expires or is invalidated
+    """
+    win_update.needs_reboot.invalidate()
+    mock_dispatch = MagicMock()
+    mock_dispatch.return_value.RebootRequired = True
+    with patch("salt.utils.winapi.Com", autospec=True), patch(
+        "win32com.client.Dispatch", mock_dispatch
+    ):
+        assert win_update.needs_reboot() is True
+        assert win_update.needs_reboot() is True
+        assert mock_dispatch.call_count == 1
+
+        win_update.needs_reboot.invalidate()
+        mock_dispatch.return_value.RebootRequired = False
+        assert win_update.needs_reboot() is False
+        assert mock_dispatch.call_count == 2
+
+        expired = time.monotonic() + win_update.NEEDS_REBOOT_TTL
+        with patch("time.monotonic", return_value=expired):
+            assert win_update.needs_reboot() is False
+        assert mock_dispatch.call_count == 3
+    win_update.needs_reboot.invalidate()
+
+
+def test_run_lines():
+    """
+    Test _run_lines yields the output of the command line by line
+    """
+    wua = _agent()
+    cmd = [sys.executable, "-c", "print('one'); print('two')"]
+    assert [line.rstrip() for line in wua._run_lines(cmd)] == ["one", "two"]
+
+
+def test_run_lines_exit_code():
+    """
+    Test _run_lines raises an error when the command returns a non-zero exit
+    code
+    """
+    wua = _agent()
+    cmd = [sys.executable, "-c", "import sys; print('one'); sys.exit(3)"]
+    lines = []
+    with pytest.raises(CommandExecutionError, match="exit code 3"):
+        for line in wua._run_lines(cmd):
+            lines.append(line.rstrip())
+    assert lines == ["one"]
+
+
+def test_run_lines_timeout():
+    """
+    Test _run_lines kills the command and raises an error when it times out
+    """
+    wua = _agent()
+    cmd = [sys.executable, "-c", "import time; time.sleep(60)"]
+    start = time.monotonic()
+    with pytest.raises(CommandExecutionError, match="timed out after 0.5"):
+        list(wua._run_lines(cmd, timeout=0.5))
+    assert time.monotonic() - start < 30
+
+
+def test_run_lines_error():
+    """
+    Test _run_lines raises an error when the command can't be run
+    """
+    wua = _agent()
+    with patch("subprocess.Popen", MagicMock(side_effect=OSError("not found"))):
+        with pytest.raises(CommandExecutionError, match="not found"):
+            list(wua._run_lines(["dism"]))